@@ -0,0 +1,205 @@
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+from lane_map import LANES, load_lane_polygons
+from trace_demand import write_count_log
+from video import (FRAME_SIZE, VEHICLE_PCU, EMERGENCY_CLASSES, TrafficLightOptimizer, load_model,
+                   detect_vehicles, class_ids, pcu_table, count_lanes, emergency_lane, fit_lane_lines,
+                   make_lane_map, make_output_row, print_results, print_preemption_summary,
+                   update_lane_geometry)
+
+# Set per worker process by _init_worker so the model is loaded once, not once per segment
+_worker_model = None
+
+def _init_worker(model_name, threads):
+    global _worker_model
+    # N workers each running a full-width thread pool just fight over the same cores
+    cv2.setNumThreads(threads)
+    import torch
+    torch.set_num_threads(threads)
+    _worker_model = load_model(model_name)
+
+def probe_video(source):
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise IOError(f"Unable to open video file: {source}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return fps, frame_total
+
+def plan_segments(frame_total, segment_frames):
+    segments = [(start, start + segment_frames) for start in range(0, frame_total, segment_frames)]
+    if segments:
+        # Container frame counts are estimates; let the last segment read to the real end of file
+        segments[-1] = (segments[-1][0], None)
+    return segments
+
+def seek(cap, source, start):
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == start:
+        return cap
+    # Some codecs/containers can't seek by frame index: reopen and skip forward instead
+    cap.release()
+    cap = cv2.VideoCapture(source)
+    for _ in range(start):
+        if not cap.grab():
+            break
+    return cap
+
+def prior_lane_lines(source, start, lane_refresh):
+    # The lane fit a serial run would hold on reaching `start`: the latest successful refit
+    # at an absolute multiple of lane_refresh before it, searching back as far as frame 0.
+    # Usually the nearest refit succeeds, so only one frame is fitted
+    cap = cv2.VideoCapture(source)
+    try:
+        for refit in range((start - 1) // lane_refresh * lane_refresh, -1, -lane_refresh):
+            cap = seek(cap, source, refit)
+            ret, frame = cap.read()
+            if not ret:
+                continue
+            fitted = fit_lane_lines(cv2.resize(frame, FRAME_SIZE))
+            if fitted is not None and None not in fitted:
+                return fitted
+    finally:
+        cap.release()
+    return None
+
+def process_segment(source, start, end, conf_threshold, lane_polygons=None, lane_refresh=30):
+    lane_map = make_lane_map(lane_polygons)
+    lane_lines = None
+    if lane_polygons is None and start > 0:
+        # Refits happen on absolute frame indices, from the geometry in effect at `start`,
+        # so fitted lanes come out the same however the recording is split
+        lane_lines = prior_lane_lines(source, start, lane_refresh)
+        if lane_lines is not None:
+            lane_map.update(lane_lines)
+    cap = seek(cv2.VideoCapture(source), source, start)
+    emergency_ids = class_ids(_worker_model.names, EMERGENCY_CLASSES)
+    vehicle_classes = class_ids(_worker_model.names, VEHICLE_PCU) + emergency_ids
+    pcu_weights = pcu_table(_worker_model.names)
+    counts = []
+    frame_index = start
+    while end is None or frame_index < end:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        resized_frame = cv2.resize(frame, FRAME_SIZE)
+        if lane_polygons is None and frame_index % lane_refresh == 0:
+            lane_lines = update_lane_geometry(lane_map, resized_frame, lane_lines)
+        detections = detect_vehicles(_worker_model, resized_frame, conf_threshold, vehicle_classes)
+        lane_counts = count_lanes(detections, pcu_weights, lane_map)
+        # Extra column: index of the lane holding an emergency vehicle, or -1
+        lane = emergency_lane(detections, emergency_ids, lane_map)
+        counts.append([lane_counts[lane] for lane in LANES] + [LANES.index(lane) if lane else -1])
+        frame_index += 1
+    cap.release()
+    return np.array(counts, dtype=np.float32).reshape(-1, len(LANES) + 1)
+
+def replay_optimizer(lane_count_matrix, times, optimizer=None):
+    # The controller is sequential state (active lane, phase timer), so it is never split
+    # across segments: workers only produce counts and the merged timeline is replayed here.
+    # times holds each row's position on that timeline in seconds
+    if optimizer is None:
+        optimizer = TrafficLightOptimizer(start_time=0.0)
+    output_data = []
+    for frame_count, (row, now) in enumerate(zip(lane_count_matrix, times.tolist())):
+        lane_counts = {lane: round(count, 2) for lane, count in zip(LANES, row.tolist())}
+        if len(row) > len(LANES) and row[len(LANES)] >= 0:
+            optimizer.request_preemption(LANES[int(row[len(LANES)])], now=now)
+        status, _, optimal_times = optimizer.step(lane_counts, now=now)
+        output_row = make_output_row(frame_count, lane_counts, optimal_times, status)
+        output_row['time'] = now
+        output_data.append(output_row)
+    print_preemption_summary(optimizer.preemption_events)
+    return output_data
+
+def process_recordings(sources, workers=None, segment_seconds=300, model_name='yolov8n.pt',
+                       conf_threshold=0.5, optimizer=None, lane_polygons=None, count_log=None,
+                       lane_refresh=30):
+    workers = workers or os.cpu_count()
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    jobs = []
+    source_rates = {}
+    for source in sources:
+        source_fps, frame_total = probe_video(source)
+        source_rates[source] = source_fps
+        for start, end in plan_segments(frame_total, max(1, int(segment_seconds * source_fps))):
+            jobs.append((source, start, end))
+    if not jobs:
+        return []
+
+    results = [None] * len(jobs)
+    started = time.time()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_name, threads)) as pool:
+        futures = {pool.submit(process_segment, source, start, end, conf_threshold, lane_polygons,
+                               lane_refresh): i
+                   for i, (source, start, end) in enumerate(jobs)}
+        for done, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            print(f"Segment {done}/{len(jobs)} done ({time.time() - started:.0f}s elapsed)")
+
+    # Recordings of one site are chained into a single continuous timeline, each timed at its
+    # own frame rate and starting one frame after the previous one ends
+    times = []
+    offset = 0.0
+    end = None
+    frame_interval = None  # of the previous recording, for the gap after its last frame
+    for (source, start, _), counts in zip(jobs, results):
+        if start == 0 and end is not None:
+            offset = end + frame_interval
+        frame_interval = 1 / source_rates[source]
+        segment_times = offset + (start + np.arange(len(counts))) * frame_interval
+        if len(segment_times):
+            end = segment_times[-1]
+        times.append(segment_times)
+    lane_count_matrix = np.concatenate(results)
+    output_data = replay_optimizer(lane_count_matrix, np.concatenate(times), optimizer)
+    if count_log:
+        write_count_log(count_log, output_data, source_rates[sources[0]])
+    return output_data
+
+def write_csv(path, output_data):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(output_data[0].keys()))
+        writer.writeheader()
+        writer.writerows(output_data)
+
+def main():
+    parser = argparse.ArgumentParser(description="Reprocess recorded footage in parallel segments")
+    parser.add_argument('sources', nargs='+', help="recordings of one site, in chronological order")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--segment-seconds', type=float, default=300,
+                        help="length of the video segment handed to each task")
+    parser.add_argument('--model', default='yolov8n.pt')
+    parser.add_argument('--conf', type=float, default=0.5)
+    parser.add_argument('--lanes', default=None, help="JSON file of lane polygons")
+    parser.add_argument('--lane-refresh', type=int, default=30,
+                        help="refit lane lines every N frames when no polygons are given")
+    parser.add_argument('--csv', default=None, help="write per-frame counts and timings here")
+    parser.add_argument('--count-log', default=None,
+                        help="write per-frame lane counts as a .npy log for replay in the simulation")
+    args = parser.parse_args()
+
+    lane_polygons = load_lane_polygons(args.lanes) if args.lanes else None
+    output_data = process_recordings(args.sources, args.workers, args.segment_seconds,
+                                     args.model, args.conf, lane_polygons=lane_polygons,
+                                     count_log=args.count_log, lane_refresh=args.lane_refresh)
+    if not output_data:
+        print("No frames processed.")
+        return
+    print_results(output_data)
+    if args.csv:
+        write_csv(args.csv, output_data)
+        print(f"Wrote {len(output_data)} rows to {args.csv}")
+
+if __name__ == "__main__":
+    main()
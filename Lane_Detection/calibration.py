@@ -0,0 +1,154 @@
+import argparse
+import json
+
+import cv2
+import numpy as np
+
+from lane_map import LANES
+
+# Calibration file (one per camera): at least four reference points on the road surface,
+# given both in resized-frame pixels and in road-plane metres, e.g. lane-marking corners
+# measured on site or read off a map:
+#   {"image": [[x, y], ...], "world": [[X, Y], ...]}
+# World Y is the distance upstream of the stop line (0 at the line, growing away from the
+# junction) and X runs across the road, so queue lengths are simply the Y of the last
+# queued vehicle
+
+def load_calibration(path):
+    with open(path) as f:
+        points = json.load(f)
+    return GroundPlane(points['image'], points['world'])
+
+class GroundPlane:
+    # Image -> road-plane mapping for one camera. The homography is fitted once; projecting
+    # any number of points afterwards is one matrix multiply and a divide
+    def __init__(self, image_points, world_points):
+        image_points = np.asarray(image_points, dtype=np.float64).reshape(-1, 2)
+        world_points = np.asarray(world_points, dtype=np.float64).reshape(-1, 2)
+        if len(image_points) < 4 or len(image_points) != len(world_points):
+            raise ValueError("Calibration needs at least four matching image/world points")
+        # Plain least squares: every reference point is surveyed, so none are outliers
+        homography, _ = cv2.findHomography(image_points, world_points, 0)
+        if homography is None:
+            raise ValueError("Calibration points are degenerate (three or more are collinear?)")
+        self.homography = homography
+        self.image_points = image_points
+        self.world_points = world_points
+
+    def project(self, points):
+        # (n, 2) pixels -> (n, 2) metres
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        projected = points @ self.homography[:, :2].T + self.homography[:, 2]
+        return projected[:, :2] / projected[:, 2:]
+
+    def ground_points(self, detections):
+        # Bottom-centre of each box, where the vehicle meets the road, in metres
+        bottom_center = np.column_stack([(detections[:, 0] + detections[:, 2]) / 2, detections[:, 3]])
+        return self.project(bottom_center)
+
+    def reprojection_error(self):
+        # Per-point error of the fit in metres
+        return np.linalg.norm(self.project(self.image_points) - self.world_points, axis=1)
+
+class GroundTracker:
+    # Nearest-neighbour association of ground points between frames, enough for per-vehicle
+    # speed. A detection only joins a track that could have reached it at max_speed since the
+    # track was last seen; tracks survive max_age missed frames before being dropped
+    def __init__(self, max_speed=40.0, gate_margin=1.5, max_age=5, smoothing=0.5):
+        self.max_speed = max_speed
+        self.gate_margin = gate_margin
+        self.max_age = max_age
+        self.smoothing = smoothing
+        self.positions = np.zeros((0, 2))
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.speeds = np.zeros(0)
+        self.seen_at = np.zeros(0)
+        self.missed = np.zeros(0, dtype=np.int64)
+        self.next_id = 0
+
+    def update(self, points, now):
+        # Returns (track id, speed in m/s) per point; speed is NaN on a track's first frame
+        n = len(points)
+        match = self.associate(points, now)
+        matched = match >= 0
+        previous = match[matched]
+
+        ids = np.empty(n, dtype=np.int64)
+        ids[matched] = self.ids[previous]
+        ids[~matched] = np.arange(self.next_id, self.next_id + (~matched).sum())
+        self.next_id += int((~matched).sum())
+
+        speeds = np.full(n, np.nan)
+        dt = np.maximum(now - self.seen_at[previous], 1e-6)
+        measured = np.linalg.norm(points[matched] - self.positions[previous], axis=1) / dt
+        old = self.speeds[previous]
+        speeds[matched] = np.where(np.isnan(old), measured,
+                                   self.smoothing * measured + (1 - self.smoothing) * old)
+
+        # Unmatched tracks are kept (unchanged) until they have been missed max_age times
+        kept = np.ones(len(self.ids), dtype=bool)
+        kept[previous] = False
+        kept &= self.missed < self.max_age
+        self.positions = np.concatenate([points, self.positions[kept]])
+        self.ids = np.concatenate([ids, self.ids[kept]])
+        self.speeds = np.concatenate([speeds, self.speeds[kept]])
+        self.seen_at = np.concatenate([np.full(n, now), self.seen_at[kept]])
+        self.missed = np.concatenate([np.zeros(n, dtype=np.int64), self.missed[kept] + 1])
+        return ids, speeds
+
+    def associate(self, points, now):
+        # Index of the track each point continues, or -1. Greedy on increasing distance, which
+        # is what Hungarian matching would pick for vehicles spaced further apart than they move
+        match = np.full(len(points), -1)
+        if not len(points) or not len(self.ids):
+            return match
+        distance = np.linalg.norm(points[:, None, :] - self.positions[None, :, :], axis=2)
+        gate = self.max_speed * (now - self.seen_at) + self.gate_margin
+        distance[distance > gate[None, :]] = np.inf
+
+        # Usual case in one step: a point whose nearest track is nobody else's nearest
+        nearest = np.argmin(distance, axis=1)
+        valid = np.isfinite(distance[np.arange(len(points)), nearest])
+        claims = np.bincount(nearest[valid], minlength=len(self.ids))
+        uncontested = valid & (claims[nearest] == 1)
+        match[uncontested] = nearest[uncontested]
+
+        # Contested tracks are settled greedily over the remaining pairs
+        used = np.zeros(len(self.ids), dtype=bool)
+        used[nearest[uncontested]] = True
+        distance[uncontested] = np.inf
+        distance[:, used] = np.inf
+        rows, cols = np.nonzero(np.isfinite(distance))
+        for k in np.argsort(distance[rows, cols]):
+            i, j = rows[k], cols[k]
+            if match[i] < 0 and not used[j]:
+                match[i] = j
+                used[j] = True
+        return match
+
+def queue_lengths(ground, speeds, lane_ids, stopped_speed=1.5):
+    # Per lane, metres from the stop line to the furthest vehicle moving slower than
+    # stopped_speed (m/s). Vehicles without a speed yet don't count as queued
+    queues = np.zeros(len(LANES))
+    queued = (speeds < stopped_speed) & (lane_ids < len(LANES)) & (ground[:, 1] >= 0)
+    np.maximum.at(queues, lane_ids[queued].astype(np.intp), ground[queued, 1])
+    return {lane: round(float(queue), 1) for lane, queue in zip(LANES, queues)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit and check a camera's road-plane calibration")
+    parser.add_argument('calibration', help="JSON file with matching image and world points")
+    parser.add_argument('--points', nargs='*', type=float, default=[],
+                        help="pixel coordinates x1 y1 x2 y2 ... to project")
+    args = parser.parse_args()
+
+    plane = load_calibration(args.calibration)
+    print("Homography (pixels -> metres):")
+    print(np.array2string(plane.homography, precision=6, suppress_small=True))
+    errors = plane.reprojection_error()
+    print(f"Reprojection error: mean {errors.mean():.3f} m | max {errors.max():.3f} m "
+          f"over {len(errors)} points")
+    for (x, y), (X, Y) in zip(np.reshape(args.points, (-1, 2)), plane.project(np.reshape(args.points, (-1, 2)))):
+        print(f"({x:.0f}, {y:.0f}) px -> ({X:.2f}, {Y:.2f}) m")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import threading
+import time
+
+import cv2
+
+
+def is_live_source(source):
+    # Camera indices and network streams are live, anything else is treated as a file
+    if isinstance(source, int):
+        return True
+    source = str(source)
+    if source.isdigit():
+        return True
+    return source.lower().startswith(('rtsp://', 'rtmp://', 'http://', 'https://', 'udp://', 'tcp://'))
+
+
+class LatestFrameGrabber:
+    def __init__(self, source, reconnect_delay=1.0, max_reconnect_delay=10.0, on_frame=None):
+        self.source = int(source) if str(source).isdigit() else source
+        # Called as on_frame(frame, captured_at) in the grabber thread for every captured
+        # frame, including the ones the consumer never reads
+        self.on_frame = on_frame
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.dropped_frames = 0
+        self.reconnects = 0
+        self._cond = threading.Condition()
+        self._frame = None
+        self._captured_at = 0.0
+        self._frame_id = 0
+        self._last_read_id = 0
+        self._running = False
+        self._thread = None
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.source)
+        # Keep the driver-side buffer as short as possible (not every backend honours this)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._grab_loop, name='frame-grabber', daemon=True)
+        self._thread.start()
+        return self
+
+    def _grab_loop(self):
+        delay = self.reconnect_delay
+        cap = self._open()
+        while self._running:
+            ret, frame = cap.read() if cap.isOpened() else (False, None)
+            if not ret:
+                # Stream lost or not yet available: back off and reopen
+                cap.release()
+                print(f"Stream {self.source} lost, reconnecting in {delay:.1f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                self.reconnects += 1
+                cap = self._open()
+                continue
+
+            delay = self.reconnect_delay
+            captured_at = time.monotonic()
+            if self.on_frame is not None:
+                self.on_frame(frame, captured_at)
+            with self._cond:
+                # Overwrite the previous frame if the consumer hasn't taken it yet
+                if self._frame_id != self._last_read_id:
+                    self.dropped_frames += 1
+                self._frame = frame
+                self._captured_at = captured_at
+                self._frame_id += 1
+                self._cond.notify()
+        cap.release()
+
+    def read(self, timeout=None):
+        # Returns the newest frame not yet seen by the caller, with its capture timestamp
+        with self._cond:
+            has_frame = self._cond.wait_for(
+                lambda: self._frame_id != self._last_read_id or not self._running, timeout)
+            if not has_frame or self._frame_id == self._last_read_id:
+                return False, None, None
+            self._last_read_id = self._frame_id
+            return True, self._frame, self._captured_at
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=self.max_reconnect_delay + 1)
@@ -0,0 +1,96 @@
+import numpy as np
+
+from simulation import TrafficLightOptimizer
+
+# State codes, replacing the 'green'/'yellow'/'red' strings of TrafficLightOptimizer
+GREEN = 0
+YELLOW = 1
+RED = 2
+STATE_NAMES = ('green', 'yellow', 'red')
+
+class ControllerBank:
+    # Same control law as simulation.TrafficLightOptimizer, held as arrays for N intersections
+    # and stepped for all of them at once from an (N, approaches) count matrix
+    def __init__(self, n, approaches, phases, weights=None, min_green_time=12, max_green_time=50,
+                 yellow_time=4, all_red_time=1.5, start_time=0.0):
+        self.n = n
+        self.approaches = list(approaches)
+        index = {approach: i for i, approach in enumerate(self.approaches)}
+        # phase_mask[p, a] is True when approach a is released in phase p
+        self.phase_mask = np.zeros((len(phases), len(self.approaches)), dtype=bool)
+        for p, phase in enumerate(phases):
+            for approach in phase:
+                self.phase_mask[p, index[approach]] = True
+        self.phase_sizes = self.phase_mask.sum(axis=1)
+
+        self.weights = np.ones((n, len(self.approaches))) if weights is None else np.array(weights, dtype=float)
+        self.min_green_time = np.full(n, min_green_time, dtype=float)
+        self.max_green_time = np.full(n, max_green_time, dtype=float)
+        self.yellow_time = np.full(n, yellow_time, dtype=float)
+        self.all_red_time = np.full(n, all_red_time, dtype=float)
+
+        self.current_phase = np.zeros(n, dtype=np.intp)
+        self.current_state = np.full(n, RED, dtype=np.int8)
+        self.state_start_time = np.full(n, start_time, dtype=float)
+        self.green_time = self.min_green_time.copy()
+
+    @classmethod
+    def from_optimizers(cls, optimizers):
+        # Lift existing per-intersection optimizers (same roads and phases) into one bank
+        first = optimizers[0]
+        approaches = first.road_keys
+        bank = cls(len(optimizers), approaches, first.phases,
+                   weights=[[o.weights.get(a[:-3], 1.0) for a in approaches] for o in optimizers])
+        for i, o in enumerate(optimizers):
+            bank.min_green_time[i] = o.min_green_time
+            bank.max_green_time[i] = o.max_green_time
+            bank.yellow_time[i] = o.yellow_time
+            bank.all_red_time[i] = o.all_red_time
+            bank.current_phase[i] = o.current_phase
+            bank.current_state[i] = STATE_NAMES.index(o.current_state)
+            bank.state_start_time[i] = o.state_start_time
+        return bank
+
+    @classmethod
+    def for_junctions(cls, n, roads=None, start_time=0.0):
+        # N copies of the simulation's 6-way junction, including its road weights
+        roads = roads or [f'road{i}' for i in range(1, 7)]
+        return cls.from_optimizers([TrafficLightOptimizer(roads, start_time=start_time)] * n)
+
+    def calculate_optimal_times(self, counts):
+        # (N, approaches) green time per approach for the current phase of every intersection
+        weighted = np.asarray(counts, dtype=float) * self.weights
+        total = weighted.sum(axis=1)
+        busy = total >= 2
+        proportion = np.divide(weighted, total[:, None], out=np.zeros_like(weighted), where=busy[:, None])
+        span = (self.max_green_time - self.min_green_time)[:, None]
+        green_times = np.round(self.min_green_time[:, None] + proportion * span)
+        green_times = np.clip(green_times, self.min_green_time[:, None], self.max_green_time[:, None])
+        green_times[~busy] = self.min_green_time[~busy, None]
+        return green_times * self.phase_mask[self.current_phase]
+
+    def phase_green_time(self, counts):
+        # Each phase runs for the mean green time of the approaches it releases
+        return self.calculate_optimal_times(counts).sum(axis=1) / self.phase_sizes[self.current_phase]
+
+    def step(self, counts, now):
+        state_duration = now - self.state_start_time
+        green = self.current_state == GREEN
+        self.green_time = np.where(green, self.phase_green_time(counts), self.green_time)
+
+        # Masks are taken before any update so each intersection moves at most one state per step
+        to_yellow = green & (state_duration >= self.green_time)
+        to_red = (self.current_state == YELLOW) & (state_duration >= self.yellow_time)
+        to_green = (self.current_state == RED) & (state_duration >= self.all_red_time)
+
+        self.current_state[to_yellow] = YELLOW
+        self.current_state[to_red] = RED
+        self.current_phase[to_red] = (self.current_phase[to_red] + 1) % len(self.phase_mask)
+        self.current_state[to_green] = GREEN
+        self.state_start_time[to_yellow | to_red | to_green] = now
+        return to_yellow | to_red | to_green
+
+    def signal_states(self):
+        # (N, approaches) light shown to each approach: its phase's state if released, else red
+        released = self.phase_mask[self.current_phase]
+        return np.where(released, self.current_state[:, None], RED).astype(np.int8)
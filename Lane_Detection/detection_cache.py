@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from lane_map import pack_lane_lines
+
+CACHE_VERSION = 3
+
+# Each cached detection row: x1, y1, x2, y2, confidence, class id
+BOX_COLUMNS = 6
+# Per frame: left and right lane line as x_start, y_start, x_end, y_end (NaN if not fitted)
+LANE_COLUMNS = 8
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def model_id(model_name):
+    # Local weight files are identified by content so retrained weights never hit a stale entry
+    if os.path.isfile(model_name):
+        return f"{os.path.basename(model_name)}:{file_digest(model_name)[:16]}"
+    return model_name
+
+class DetectionCache:
+    def __init__(self, cache_dir, source, model_name, conf_threshold, frame_size, classes=None):
+        self.key_fields = {
+            'version': CACHE_VERSION,
+            'source': file_digest(source),
+            'model': model_id(model_name),
+            'conf': round(float(conf_threshold), 4),
+            'frame_size': list(frame_size),
+            # Inference is class-filtered, so the class set is part of what was detected
+            'classes': sorted(classes) if classes is not None else None
+        }
+        key = hashlib.sha1(json.dumps(self.key_fields, sort_keys=True).encode()).hexdigest()[:20]
+        self.path = os.path.join(cache_dir, key)
+        self.meta = None
+        self._boxes = None
+        self._offsets = None
+        self._lanes = None
+        self._pending = []
+        self._pending_lanes = []
+
+    def load(self):
+        meta_path = os.path.join(self.path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if not meta.get('complete') or meta.get('key') != self.key_fields:
+            return False
+
+        # Memory-mapped so only the frames actually visited are paged in
+        self._boxes = np.load(os.path.join(self.path, 'boxes.npy'), mmap_mode='r')
+        self._offsets = np.load(os.path.join(self.path, 'offsets.npy'), mmap_mode='r')
+        self._lanes = np.load(os.path.join(self.path, 'lanes.npy'), mmap_mode='r')
+        self.meta = meta
+        return True
+
+    def __len__(self):
+        if self._offsets is None:
+            return len(self._pending)
+        return len(self._offsets) - 1
+
+    def get(self, frame_index):
+        start, end = self._offsets[frame_index], self._offsets[frame_index + 1]
+        return self._boxes[start:end]
+
+    def get_lane_lines(self, frame_index):
+        return self._lanes[frame_index]
+
+    def append(self, detections, lane_lines=None):
+        self._pending.append(np.asarray(detections, dtype=np.float32).reshape(-1, BOX_COLUMNS))
+        # Lane geometry in effect for the frame, so replays count against the same lanes
+        self._pending_lanes.append(pack_lane_lines(lane_lines))
+
+    def save(self, names, fps, complete=True):
+        os.makedirs(self.path, exist_ok=True)
+        if self._pending:
+            boxes = np.concatenate(self._pending)
+        else:
+            boxes = np.empty((0, BOX_COLUMNS), dtype=np.float32)
+        offsets = np.zeros(len(self._pending) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(d) for d in self._pending])
+        lanes = np.array(self._pending_lanes, dtype=np.float32).reshape(-1, LANE_COLUMNS)
+
+        # Arrays first, metadata last: a cache entry only counts once meta.json is in place
+        for name, array in (('boxes.npy', boxes), ('offsets.npy', offsets), ('lanes.npy', lanes)):
+            tmp_path = os.path.join(self.path, name + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, os.path.join(self.path, name))
+
+        meta = {
+            'key': self.key_fields,
+            'frames': len(self._pending),
+            'fps': fps,
+            'names': list(names),
+            'complete': complete
+        }
+        tmp_path = os.path.join(self.path, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.path, 'meta.json'))
+        self.meta = meta
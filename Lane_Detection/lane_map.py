@@ -0,0 +1,94 @@
+import json
+
+import cv2
+import numpy as np
+
+LANES = ('left_lane', 'center', 'right_lane')
+
+# Label for pixels that belong to no configured lane
+NO_LANE = 255
+
+def pack_lane_lines(lane_lines):
+    # Flat float row for storage; NaN means "no fitted geometry, thirds were in effect"
+    row = np.full(8, np.nan, dtype=np.float32)
+    if lane_lines is not None:
+        for i, line in enumerate(lane_lines):
+            if line is not None:
+                row[i * 4:(i + 1) * 4] = line
+    return row
+
+def unpack_lane_lines(row):
+    if np.isnan(row).all():
+        return None
+    return tuple(None if np.isnan(row[i * 4]) else [int(v) for v in row[i * 4:(i + 1) * 4]]
+                 for i in range(2))
+
+def load_lane_polygons(path):
+    # JSON mapping lane name -> list of [x, y] points in resized-frame coordinates
+    with open(path) as f:
+        return json.load(f)
+
+class LaneLabelMap:
+    def __init__(self, frame_size, tolerance=8):
+        self.width, self.height = frame_size
+        self.tolerance = tolerance
+        self._rows = np.arange(self.height, dtype=np.float32)
+        self._cols = np.arange(self.width, dtype=np.float32)
+        self._key = None
+        self.labels = None
+        self.update(None)
+
+    def update(self, lane_lines):
+        # Endpoints are quantized so Hough jitter between frames doesn't force a rebuild
+        key = ('lines', tuple(
+            None if line is None else tuple(int(round(v / self.tolerance)) for v in line)
+            for line in (lane_lines or (None, None))))
+        if key == self._key:
+            return False
+        self.labels = self._build_from_lines(lane_lines)
+        self._key = key
+        return True
+
+    def set_polygons(self, polygons):
+        key = ('polygons', tuple(sorted((lane, tuple(map(tuple, pts))) for lane, pts in polygons.items())))
+        if key == self._key:
+            return False
+        labels = np.full((self.height, self.width), NO_LANE, dtype=np.uint8)
+        for lane_id, lane in enumerate(LANES):
+            if lane in polygons:
+                cv2.fillPoly(labels, [np.array(polygons[lane], dtype=np.int32)], lane_id)
+        self.labels = labels
+        self._key = key
+        return True
+
+    def _boundary(self, line, default_x):
+        # x of the lane line on every row, extrapolated over the full frame height
+        if line is None:
+            return np.full(self.height, default_x, dtype=np.float32)
+        x_start, y_start, x_end, y_end = line
+        slope = (x_end - x_start) / (y_end - y_start)
+        return x_start + (self._rows - y_start) * slope
+
+    def _build_from_lines(self, lane_lines):
+        # Without fitted lines the boundaries fall back to fixed thirds of the frame width
+        left_line, right_line = lane_lines or (None, None)
+        left_x = self._boundary(left_line, self.width / 3)
+        right_x = self._boundary(right_line, 2 * self.width / 3)
+        labels = (self._cols[None, :] >= left_x[:, None]).astype(np.uint8)
+        labels += self._cols[None, :] > right_x[:, None]
+        return labels
+
+    def assign(self, detections):
+        # Lane id for every box, looked up at its bottom-center (the road contact point)
+        detections = np.asarray(detections)
+        cx = ((detections[:, 0] + detections[:, 2]) / 2).astype(np.intp)
+        by = (detections[:, 3] - 1).astype(np.intp)
+        np.clip(cx, 0, self.width - 1, out=cx)
+        np.clip(by, 0, self.height - 1, out=by)
+        return self.labels[by, cx]
+
+    def count(self, lane_ids, weights=None):
+        valid = lane_ids < len(LANES)
+        if weights is not None:
+            weights = weights[valid]
+        return np.bincount(lane_ids[valid], weights=weights, minlength=len(LANES))
@@ -0,0 +1,107 @@
+import json
+
+import numpy as np
+
+class SimMetrics:
+    # Streaming counters for a simulation run. Everything is preallocated from the approach and
+    # phase lists, so recording an event only increments existing array cells
+    def __init__(self, approaches, n_phases, bin_width=2.0, max_delay=120.0):
+        self.approaches = list(approaches)
+        self.index = {approach: i for i, approach in enumerate(self.approaches)}
+        self.bin_width = bin_width
+        # Last bin collects every delay >= max_delay
+        self.n_bins = int(np.ceil(max_delay / bin_width)) + 1
+        self.delay_hist = np.zeros((len(self.approaches), self.n_bins), dtype=np.int64)
+        self.delay_sum = np.zeros(len(self.approaches))
+        self.served = np.zeros(len(self.approaches), dtype=np.int64)
+        self.served_per_phase = np.zeros(n_phases, dtype=np.int64)
+        self.max_queue = np.zeros(len(self.approaches), dtype=np.int64)
+
+        self.cycles = 0
+        self.cycle_sum = 0.0
+        self.cycle_min = float('inf')
+        self.cycle_max = 0.0
+        self._cycle_start = None
+        self._green_phase = None
+        self.time = 0.0
+
+    def record_departure(self, approach, delay, phase):
+        # A vehicle crossed the stop line after waiting `delay` seconds
+        a = self.index[approach]
+        self.delay_hist[a, min(int(delay / self.bin_width), self.n_bins - 1)] += 1
+        self.delay_sum[a] += delay
+        self.served[a] += 1
+        self.served_per_phase[phase] += 1
+
+    def observe(self, vehicle_counts, optimizer, now):
+        # Called once per step with the counts the controller saw
+        self.time = now
+        for approach, count in vehicle_counts.items():
+            a = self.index.get(approach)
+            if a is not None and count > self.max_queue[a]:
+                self.max_queue[a] = count
+
+        # Cycle length: time between consecutive starts of phase 0 green
+        green_phase = optimizer.current_phase if optimizer.current_state == 'green' else None
+        if green_phase == 0 and self._green_phase != 0:
+            if self._cycle_start is not None:
+                cycle = now - self._cycle_start
+                self.cycles += 1
+                self.cycle_sum += cycle
+                self.cycle_min = min(self.cycle_min, cycle)
+                self.cycle_max = max(self.cycle_max, cycle)
+            self._cycle_start = now
+        self._green_phase = green_phase
+
+    def delay_percentile(self, q, hist=None):
+        # Upper edge of the histogram bin holding the q-th percentile
+        hist = self.delay_hist.sum(axis=0) if hist is None else hist
+        total = hist.sum()
+        if total == 0:
+            return 0.0
+        b = int(np.searchsorted(np.cumsum(hist), q / 100 * total))
+        return min(b + 1, self.n_bins - 1) * self.bin_width
+
+    def summary(self):
+        served = int(self.served.sum())
+        return {
+            'time': self.time,
+            'served': served,
+            'avg_delay': float(self.delay_sum.sum() / served) if served else 0.0,
+            'p95_delay': self.delay_percentile(95),
+            'throughput_per_hour': served / self.time * 3600 if self.time else 0.0,
+            'max_queue': int(self.max_queue.max()),
+            'served_per_phase': self.served_per_phase.tolist(),
+            'cycles': self.cycles,
+            'avg_cycle': self.cycle_sum / self.cycles if self.cycles else 0.0,
+            'min_cycle': self.cycle_min if self.cycles else 0.0,
+            'max_cycle': self.cycle_max,
+            'approaches': {
+                approach: {
+                    'served': int(self.served[a]),
+                    'avg_delay': float(self.delay_sum[a] / self.served[a]) if self.served[a] else 0.0,
+                    'p95_delay': self.delay_percentile(95, self.delay_hist[a]),
+                    'max_queue': int(self.max_queue[a]),
+                    'delay_histogram': self.delay_hist[a].tolist()
+                }
+                for a, approach in enumerate(self.approaches)
+            }
+        }
+
+    def export(self, path):
+        # One JSON line per call, so periodic exports of a long run can be tailed or plotted
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.summary()) + '\n')
+
+def print_summary(summary):
+    print(f"Served {summary['served']} | avg delay {summary['avg_delay']:.1f}s | "
+          f"p95 delay {summary['p95_delay']:.0f}s | throughput {summary['throughput_per_hour']:.0f} veh/h | "
+          f"max queue {summary['max_queue']}")
+    print(f"Cycles {summary['cycles']} | avg cycle {summary['avg_cycle']:.1f}s "
+          f"(min {summary['min_cycle']:.1f}s, max {summary['max_cycle']:.1f}s) | "
+          f"served per phase {summary['served_per_phase']}")
+    print("Approach  | Served | Avg delay | p95 delay | Max queue")
+    for approach, stats in summary['approaches'].items():
+        if stats['served'] or stats['max_queue']:
+            print(f"{approach:9} | {stats['served']:6} | {stats['avg_delay']:8.1f}s | "
+                  f"{stats['p95_delay']:8.0f}s | {stats['max_queue']:9}")
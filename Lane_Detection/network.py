@@ -0,0 +1,247 @@
+import argparse
+import heapq
+import math
+import multiprocessing as mp
+import random
+import time
+from collections import deque, namedtuple
+
+from simulation import TrafficLightOptimizer
+
+ROADS = [f'road{i}' for i in range(1, 7)]
+
+# A directed road between two junctions: vehicles leaving from_node on from_road (an '_out'
+# approach) reach to_node's to_road ('_in' approach) travel_time seconds later
+Link = namedtuple('Link', ['from_node', 'from_road', 'to_node', 'to_road', 'travel_time'])
+
+def opposite_road(road):
+    # Through movement: road1 <-> road4, road2 <-> road5, road3 <-> road6
+    return f"road{(int(road[-1]) + 2) % 6 + 1}"
+
+def poisson(rng, lam):
+    threshold = math.exp(-lam)
+    k = 0
+    p = rng.random()
+    while p > threshold:
+        k += 1
+        p *= rng.random()
+    return k
+
+class Junction:
+    def __init__(self, node_id, offset=0.0, arrival_rates=None, saturation_flow=0.5, seed=0):
+        self.node_id = node_id
+        # The offset delays this junction's first green, which is what lines up a green wave
+        self.optimizer = TrafficLightOptimizer(ROADS, start_time=offset)
+        self.queues = {f"{road}_in": deque() for road in ROADS}
+        self.arrival_rates = arrival_rates or {}
+        self.saturation_flow = saturation_flow
+        # Per-junction RNG, so results don't depend on how junctions are split into regions
+        self.rng = random.Random(seed * 1000003 + node_id)
+        self._discharge_credit = dict.fromkeys(self.queues, 0.0)
+        self.served = 0
+        self.total_delay = 0.0
+        self.max_queue = 0
+
+    def step(self, now, dt):
+        for road_key, rate in self.arrival_rates.items():
+            for _ in range(poisson(self.rng, rate * dt)):
+                self.queues[road_key].append(now)
+
+        counts = {road_key: len(queue) for road_key, queue in self.queues.items()}
+        self.max_queue = max(self.max_queue, max(counts.values()))
+        self.optimizer.step(counts, now)
+
+        departures = []
+        if self.optimizer.current_state != 'green':
+            return departures
+        for road_key in self.optimizer.phases[self.optimizer.current_phase]:
+            queue = self.queues.get(road_key)
+            if not queue:
+                if queue is not None:
+                    self._discharge_credit[road_key] = 0.0
+                continue
+            # Queued vehicles leave at the saturation flow rate while the approach is green
+            self._discharge_credit[road_key] += self.saturation_flow * dt
+            while queue and self._discharge_credit[road_key] >= 1:
+                self._discharge_credit[road_key] -= 1
+                self.total_delay += now - queue.popleft()
+                self.served += 1
+                departures.append(f"{opposite_road(road_key[:-3])}_out")
+        return departures
+
+    def stats(self):
+        return {
+            'node': self.node_id,
+            'served': self.served,
+            'avg_delay': self.total_delay / self.served if self.served else 0.0,
+            'max_queue': self.max_queue,
+            'queued': sum(len(queue) for queue in self.queues.values())
+        }
+
+class Region:
+    def __init__(self, junctions, links, dt):
+        self.junctions = {junction.node_id: junction for junction in junctions}
+        self.routes = {(link.from_node, link.from_road): link
+                       for link in links if link.from_node in self.junctions}
+        self.dt = dt
+        self.step_index = 0
+        # Vehicles travelling on links into this region: (arrival time, node, road)
+        self.in_flight = []
+
+    def advance(self, inbound, until_step):
+        for vehicle in inbound:
+            heapq.heappush(self.in_flight, vehicle)
+
+        outbound = []
+        while self.step_index < until_step:
+            now = self.step_index * self.dt
+            while self.in_flight and self.in_flight[0][0] <= now:
+                arrival_time, node_id, road_key = heapq.heappop(self.in_flight)
+                self.junctions[node_id].queues[road_key].append(arrival_time)
+
+            for junction in self.junctions.values():
+                for out_road in junction.step(now, self.dt):
+                    link = self.routes.get((junction.node_id, out_road))
+                    if link is None:
+                        continue  # leaves the network
+                    vehicle = (now + link.travel_time, link.to_node, link.to_road)
+                    if link.to_node in self.junctions:
+                        heapq.heappush(self.in_flight, vehicle)
+                    else:
+                        outbound.append(vehicle)
+            self.step_index += 1
+        return outbound
+
+    def stats(self):
+        return [junction.stats() for junction in self.junctions.values()]
+
+def _region_worker(conn, region):
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        inbound, until_step = message
+        conn.send(region.advance(inbound, until_step))
+    conn.send(region.stats())
+    conn.close()
+
+class CorridorNetwork:
+    def __init__(self, junctions, links, dt=1.0, regions=1):
+        self.dt = dt
+        junctions = sorted(junctions, key=lambda junction: junction.node_id)
+        size = math.ceil(len(junctions) / regions)
+        chunks = [junctions[i:i + size] for i in range(0, len(junctions), size)]
+        self.regions = [Region(chunk, links, dt) for chunk in chunks]
+        self.region_of = {junction.node_id: r for r, chunk in enumerate(chunks) for junction in chunk}
+
+        # Regions only exchange vehicles at epoch boundaries. That is exact as long as no
+        # vehicle can cross between regions faster than one epoch (the link travel time)
+        boundary = [link.travel_time for link in links
+                    if self.region_of[link.from_node] != self.region_of[link.to_node]]
+        self.epoch_steps = max(1, int(min(boundary) // dt)) if boundary else None
+
+    def run(self, duration, processes=True):
+        total_steps = int(round(duration / self.dt))
+        epoch_steps = self.epoch_steps or total_steps
+        inbound = [[] for _ in self.regions]
+
+        if processes and len(self.regions) > 1:
+            connections = []
+            workers = []
+            for region in self.regions:
+                parent_conn, child_conn = mp.Pipe()
+                worker = mp.Process(target=_region_worker, args=(child_conn, region), daemon=True)
+                worker.start()
+                connections.append(parent_conn)
+                workers.append(worker)
+        else:
+            connections = None
+
+        step = 0
+        while step < total_steps:
+            step = min(step + epoch_steps, total_steps)
+            if connections:
+                for conn, vehicles in zip(connections, inbound):
+                    conn.send((vehicles, step))
+                outbound = [conn.recv() for conn in connections]
+            else:
+                outbound = [region.advance(vehicles, step) for region, vehicles in zip(self.regions, inbound)]
+
+            # Boundary hand-off: route every vehicle that left a region to its destination region
+            inbound = [[] for _ in self.regions]
+            for vehicles in outbound:
+                for vehicle in vehicles:
+                    inbound[self.region_of[vehicle[1]]].append(vehicle)
+
+        if connections:
+            stats = []
+            for conn, worker in zip(connections, workers):
+                conn.send(None)
+                stats.extend(conn.recv())
+                worker.join()
+        else:
+            stats = [s for region in self.regions for s in region.stats()]
+        return sorted(stats, key=lambda s: s['node'])
+
+def nominal_cycle(optimizer):
+    # Cycle length when every phase runs its minimum green
+    per_phase = optimizer.min_green_time + optimizer.yellow_time + optimizer.all_red_time
+    return per_phase * len(optimizer.phases)
+
+def build_corridor(n, travel_time=30.0, offsets='green-wave', main_rate=0.15, side_rate=0.05,
+                   seed=0, cycle=None):
+    # n junctions in a west-east line; road4 faces west, road1 faces east
+    cycle = cycle or nominal_cycle(TrafficLightOptimizer(ROADS, start_time=0.0))
+    if offsets == 'green-wave':
+        # Phase 0 (the main road) turns green as the eastbound platoon from upstream arrives
+        offset_of = lambda i: (i * travel_time) % cycle
+    elif offsets == 'random':
+        rng = random.Random(seed)
+        offset_of = lambda i: rng.uniform(0, cycle)
+    else:
+        offset_of = lambda i: 0.0
+
+    junctions = []
+    for i in range(n):
+        rates = {f"{road}_in": side_rate for road in ('road2', 'road3', 'road5', 'road6')}
+        if i == 0:
+            rates['road4_in'] = main_rate   # eastbound traffic enters at the west end
+        if i == n - 1:
+            rates['road1_in'] = main_rate   # westbound traffic enters at the east end
+        junctions.append(Junction(i, offset=offset_of(i), arrival_rates=rates, seed=seed))
+
+    links = []
+    for i in range(n - 1):
+        links.append(Link(i, 'road1_out', i + 1, 'road4_in', travel_time))
+        links.append(Link(i + 1, 'road4_out', i, 'road1_in', travel_time))
+    return junctions, links
+
+def print_summary(stats, elapsed):
+    served = sum(s['served'] for s in stats)
+    delay = sum(s['avg_delay'] * s['served'] for s in stats)
+    print("Node | Served | Avg delay | Max queue")
+    for s in stats:
+        print(f"{s['node']:4} | {s['served']:6} | {s['avg_delay']:8.1f}s | {s['max_queue']:9}")
+    print(f"\nTotal served: {served} | Mean delay: {delay / served if served else 0:.1f}s | "
+          f"Wall time: {elapsed:.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Corridor of adaptive intersections")
+    parser.add_argument('--junctions', type=int, default=20)
+    parser.add_argument('--regions', type=int, default=4, help="partitions stepped in separate processes")
+    parser.add_argument('--duration', type=float, default=3600, help="simulated seconds")
+    parser.add_argument('--dt', type=float, default=1.0)
+    parser.add_argument('--travel-time', type=float, default=30.0, help="seconds between junctions")
+    parser.add_argument('--offsets', choices=['green-wave', 'zero', 'random'], default='green-wave')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--in-process', action='store_true', help="step regions in this process")
+    args = parser.parse_args()
+
+    junctions, links = build_corridor(args.junctions, args.travel_time, args.offsets, seed=args.seed)
+    network = CorridorNetwork(junctions, links, dt=args.dt, regions=args.regions)
+    started = time.time()
+    stats = network.run(args.duration, processes=not args.in_process)
+    print_summary(stats, time.time() - started)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import math
+import time
+
+import numpy as np
+
+from simulation import TrafficLightOptimizer
+
+class PredictiveOptimizer(TrafficLightOptimizer):
+    # Model-predictive variant of TrafficLightOptimizer. While a phase is green it re-plans
+    # every replan_interval seconds: candidate (this phase, next phase) green times are scored
+    # with a point-queue model over a short horizon and the one with the lowest predicted
+    # weighted delay is kept. Candidates are scored in chunks and a chunk is only started if it
+    # is expected to finish inside budget_ms; when the coarse grid can't be scored in time the
+    # proportional rule of the base class is used for that decision instead
+    def __init__(self, roads, start_time=None, arrival_rates=None, default_arrival_rate=0.05,
+                 saturation_flow=0.5, lost_time=2.0, horizon=120.0, dt=2.0, replan_interval=2.0,
+                 budget_ms=3.0, chunk_size=16):
+        super().__init__(roads, start_time)
+        self.saturation_flow = saturation_flow
+        self.lost_time = lost_time
+        self.horizon = horizon
+        self.dt = dt
+        self.replan_interval = replan_interval
+        self.budget_ms = budget_ms
+        self.chunk_size = chunk_size
+        self.default_arrival_rate = default_arrival_rate
+        # Only the approaches that queue at the stop line are modelled
+        self.approaches = [road_key for road_key in self.road_keys if road_key.endswith('_in')]
+        self.set_arrival_rates(arrival_rates or {})
+
+        # _release[a, p] is True when approach a is released in phase p
+        self._release = np.array([[approach in phase for phase in self.phases] for approach in self.approaches])
+        self._approach_weights = np.array([self.weights.get(approach[:-3], 1.0) for approach in self.approaches])
+
+        self._plan = None
+        self._decided_for = None
+        self.decisions = 0
+        self.fallbacks = 0
+        self.last_decision_ms = 0.0
+
+        # Expected seconds per chunk: a peak that decays towards the running average, so one
+        # slow chunk makes the next decisions cautious without locking them into the fallback.
+        # Seeded with a timed run after an untimed one, since the first call runs cold
+        self._chunk_seconds = 0.0
+        self._chunk_average = None
+        seed = self.candidate_grid((self.min_green_time, self.max_green_time),
+                                   (self.min_green_time, self.max_green_time), 4, 8)[:chunk_size]
+        self.predict_delay(np.zeros(len(self.approaches)), seed)
+        self.score_chunks(np.zeros(len(self.approaches)), seed, 0.0, float('inf'))
+
+    def set_arrival_rates(self, arrival_rates):
+        # Vehicles per second per approach, as used by the queue model
+        self.arrival_rates = np.array([arrival_rates.get(approach, self.default_arrival_rate)
+                                       for approach in self.approaches])
+
+    def get_plan(self, vehicle_counts, now=None):
+        # Without a clock the plan is made once, when the phase turns green
+        elapsed = 0.0 if now is None else max(0.0, now - self.state_start_time)
+        decided_for = (self.current_phase, self.state_start_time, int(elapsed // self.replan_interval))
+        if decided_for != self._decided_for:
+            self._plan = self.decide(vehicle_counts, elapsed)
+            self._decided_for = decided_for
+        return self._plan
+
+    def decide(self, vehicle_counts, elapsed=0.0):
+        started = time.perf_counter()
+        deadline = started + self.budget_ms / 1000
+        self.decisions += 1
+        vehicle_counts = {road_key: vehicle_counts.get(road_key, 0) for road_key in self.road_keys}
+        fallback = self.calculate_optimal_times(vehicle_counts)
+        queues = np.array([vehicle_counts[approach] for approach in self.approaches], dtype=float)
+        self._chunk_seconds = max(self._chunk_average, 0.9 * self._chunk_seconds)
+
+        # Coarse grid first, then a finer grid around the best coarse plan if time remains.
+        # The current phase can end now (once past minimum green) but never in the past
+        first = (max(self.min_green_time, elapsed), self.max_green_time)
+        second = (self.min_green_time, self.max_green_time)
+        proportional = sum(fallback.values()) / len(fallback)
+        coarse = self.candidate_grid(first, second, 4, 8, extra=proportional)
+        costs = self.score_chunks(queues, coarse, elapsed, deadline, complete=True)
+        if not np.isfinite(costs).all():
+            self.fallbacks += 1
+            self.last_decision_ms = (time.perf_counter() - started) * 1000
+            return fallback
+        best = coarse[np.argmin(costs)]
+
+        fine = self.candidate_grid((max(first[0], best[0] - 3), best[0] + 3),
+                                   (best[1] - 6, best[1] + 6), 1, 2)
+        # Whatever part of the fine grid fits in the remaining budget is used
+        fine_costs = self.score_chunks(queues, fine, elapsed, deadline)
+        if fine_costs.min() < costs.min():
+            best = fine[np.argmin(fine_costs)]
+
+        self.last_decision_ms = (time.perf_counter() - started) * 1000
+        return {road: float(best[0]) for road in self.phases[self.current_phase]}
+
+    def score_chunks(self, queues, candidates, elapsed, deadline, complete=False):
+        # predict_delay over chunks of candidates, stopping before a chunk that is expected to
+        # run past the deadline (perf_counter seconds). Unscored candidates cost inf. With
+        # complete=True nothing is scored unless every chunk is expected to fit
+        costs = np.full(len(candidates), np.inf)
+        n_chunks = -(-len(candidates) // self.chunk_size)
+        expected = (n_chunks - 1) * (self._chunk_average or 0.0) + self._chunk_seconds
+        if complete and time.perf_counter() + expected > deadline:
+            # Nothing is measured while we fall back, so let the estimate itself decay; a stale
+            # slow average can't then lock the controller into the fallback
+            self._chunk_average *= 0.9
+            return costs
+        for start in range(0, len(candidates), self.chunk_size):
+            chunk_started = time.perf_counter()
+            if chunk_started + self._chunk_seconds > deadline:
+                break
+            costs[start:start + self.chunk_size] = self.predict_delay(
+                queues, candidates[start:start + self.chunk_size], elapsed)
+            observed = time.perf_counter() - chunk_started
+            self._chunk_average = observed if self._chunk_average is None else \
+                0.9 * self._chunk_average + 0.1 * observed
+            self._chunk_seconds = max(observed, self._chunk_seconds)
+        return costs
+
+    def candidate_grid(self, first_range, second_range, first_step, second_step, extra=None):
+        # (C, 2) green times for the current and the next phase, clipped to the allowed range
+        first = np.arange(first_range[0], first_range[1] + 1e-9, first_step)
+        if extra is not None:
+            first = np.append(first, max(extra, first_range[0]))
+        second = np.arange(second_range[0], second_range[1] + 1e-9, second_step)
+        grid = np.stack(np.meshgrid(first, second, indexing='ij'), axis=-1).reshape(-1, 2)
+        return np.clip(grid, (first_range[0], self.min_green_time), self.max_green_time)
+
+    def predict_delay(self, queues, candidates, elapsed=0.0):
+        # Weighted vehicle-seconds of delay over the horizon for every candidate at once, with
+        # the current phase already green for `elapsed` seconds. After the two planned phases
+        # the rest of the horizon runs phases at minimum green
+        lost = self.yellow_time + self.all_red_time + self.lost_time
+        n_rest = math.ceil(self.horizon / (self.min_green_time + lost)) + 1
+        durations = np.empty((len(candidates), 2 * (2 + n_rest)))
+        durations[:, 0:4:2] = candidates
+        durations[:, 0] -= elapsed
+        durations[:, 4::2] = self.min_green_time
+        durations[:, 1::2] = lost
+        ends = np.cumsum(durations, axis=1)
+
+        # (C, T) segment index of every time step; even segments are green, odd ones lost time.
+        # Rows are shifted apart so one searchsorted call covers every candidate
+        t = (np.arange(int(self.horizon / self.dt)) + 0.5) * self.dt
+        shift = (np.arange(len(candidates)) * (ends[:, -1].max() + 1))[:, None]
+        segment = np.searchsorted((ends + shift).ravel(), (t + shift).ravel(), side='right')
+        segment = segment.reshape(len(candidates), -1) - np.arange(len(candidates))[:, None] * ends.shape[1]
+        phase = (self.current_phase + segment // 2) % len(self.phases)
+        green = segment % 2 == 0
+
+        # (A, C, T) so the scans below run along contiguous memory. Point queues follow
+        # q_t = max(0, q_{t-1} + arrivals - departures), solved for all candidates at once
+        # via the Lindley form q_t = S_t + max(q_0, -min_{k<=t} S_k)
+        released = self._release[:, phase] & green
+        net = (self.arrival_rates * self.dt)[:, None, None] - released * (self.saturation_flow * self.dt)
+        cumulative = np.cumsum(net, axis=2)
+        lowest = np.minimum.accumulate(np.minimum(cumulative, 0), axis=2)
+        queue = cumulative + np.maximum(queues[:, None, None], -lowest)
+        return np.einsum('act,a->c', queue, self._approach_weights) * self.dt
@@ -0,0 +1,98 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+import numpy as np
+
+class PhaseTimer:
+    # Lap timer for a loop: start() at the top of an iteration, then mark(name) after each
+    # phase records the time since the previous mark. Keeps a rolling window per phase for
+    # display and running totals for the end-of-run summary
+    def __init__(self, window=120):
+        self.window = window
+        self.recent = defaultdict(lambda: deque(maxlen=window))
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self._last = time.perf_counter()
+
+    def start(self):
+        self._last = time.perf_counter()
+
+    def mark(self, name):
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self._last = now
+        self.recent[name].append(elapsed)
+        self.totals[name] += elapsed
+        self.counts[name] += 1
+
+    def recent_ms(self, *names):
+        # Mean over the rolling window, summed over the given phases
+        return sum(1000 * sum(self.recent[name]) / len(self.recent[name])
+                   for name in names if self.recent[name])
+
+    def summary(self):
+        # {phase: (calls, mean ms, p95 ms of the recent window, share of total time)}
+        total = sum(self.totals.values()) or 1.0
+        return {name: (self.counts[name], 1000 * self.totals[name] / self.counts[name],
+                       1000 * float(np.percentile(self.recent[name], 95)), self.totals[name] / total)
+                for name in self.totals}
+
+def print_phase_summary(timer):
+    print(f"{'Phase':<14}{'Calls':>8}{'Mean ms':>10}{'p95 ms':>10}{'Share':>8}")
+    for name, (calls, mean_ms, p95_ms, share) in sorted(timer.summary().items(), key=lambda item: -item[1][3]):
+        print(f"{name:<14}{calls:>8}{mean_ms:>10.3f}{p95_ms:>10.3f}{share:>7.1%}")
+
+class SamplingProfiler:
+    # Low-overhead statistical profiler: a background thread looks at another thread's
+    # current stack every `interval` seconds via sys._current_frames(). Nothing is
+    # instrumented, so the sampled code runs at full speed apart from the GIL hand-offs.
+    # Stacks are kept in the collapsed format read by flamegraph.pl and speedscope
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample_loop, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name}@{os.path.basename(code.co_filename)}:{code.co_firstlineno}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top(self, n=10):
+        # Functions by self time (share of samples in which they were the innermost frame)
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return [(frame, count / max(1, self.samples)) for frame, count in leaves.most_common(n)]
+
+def print_profile(profiler, path, n=10):
+    print(f"Wrote {profiler.samples} stack samples to {path}; top functions by self time:")
+    for frame, share in profiler.top(n):
+        print(f"  {share:6.1%}  {frame}")
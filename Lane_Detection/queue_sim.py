@@ -0,0 +1,222 @@
+import argparse
+import heapq
+import itertools
+import random
+import time
+from collections import deque
+
+from simulation import TrafficLightOptimizer
+
+ROADS = [f'road{i}' for i in range(1, 7)]
+
+# Event kinds
+ARRIVAL = 0
+DEPARTURE = 1
+GREEN_START = 2
+GREEN_END = 3
+YELLOW_END = 4
+
+class QueueSimulation:
+    # Discrete-event version of the junction: only arrivals, departures and signal changes
+    # are simulated, while the timing decisions still come from TrafficLightOptimizer
+    def __init__(self, optimizer=None, arrival_rates=None, trace=None, saturation_flow=0.5,
+                 lost_time=2.0, fixed_green=None, seed=0):
+        self.optimizer = optimizer or TrafficLightOptimizer(ROADS, start_time=0.0)
+        self.phases = self.optimizer.generate_phases()
+        self.approaches = [f"{road}_in" for road in self.optimizer.roads]
+        self.arrival_rates = arrival_rates or {}
+        self.trace = iter(trace) if trace is not None else None
+        self.headway = 1.0 / saturation_flow
+        self.lost_time = lost_time
+        self.fixed_green = fixed_green
+        self.rng = random.Random(seed)
+
+        self.now = 0.0
+        self.events = []
+        self._seq = itertools.count()
+        self.queues = {approach: deque() for approach in self.approaches}
+        self.next_free = dict.fromkeys(self.approaches, 0.0)
+        self.departure_pending = dict.fromkeys(self.approaches, False)
+        self.green_start = 0.0
+        self.green_end = 0.0
+        self._green_token = 0
+
+        self.served = dict.fromkeys(self.approaches, 0)
+        self.total_delay = dict.fromkeys(self.approaches, 0.0)
+        self.max_queue = dict.fromkeys(self.approaches, 0)
+        self.cycles = 0
+
+    def schedule(self, at, kind, data=None):
+        heapq.heappush(self.events, (at, next(self._seq), kind, data))
+
+    def counts(self):
+        return {approach: len(queue) for approach, queue in self.queues.items()}
+
+    def released(self, approach):
+        return (self.optimizer.current_state == 'green'
+                and approach in self.phases[self.optimizer.current_phase])
+
+    def schedule_next_arrival(self, approach=None):
+        if self.trace is not None:
+            # Trace events are pulled one at a time, so arbitrarily long traces stream through
+            for at, trace_approach in self.trace:
+                if trace_approach in self.queues:
+                    self.schedule(at, ARRIVAL, trace_approach)
+                    return
+            return
+        rate = self.arrival_rates.get(approach, 0)
+        if rate > 0:
+            self.schedule(self.now + self.rng.expovariate(rate), ARRIVAL, approach)
+
+    def start_departures(self, approach):
+        if self.queues[approach] and not self.departure_pending[approach]:
+            self.departure_pending[approach] = True
+            self.schedule(max(self.now, self.next_free[approach]), DEPARTURE, approach)
+
+    def update_green_end(self):
+        # Same rule as update_phase: the phase ends once it has run for the mean planned
+        # green of its approaches, re-evaluated whenever the queues change
+        if self.fixed_green is not None:
+            green_time = self.fixed_green
+        else:
+            plan = self.optimizer.get_plan(self.counts(), self.now)
+            green_time = sum(plan.values()) / len(plan)
+        green_end = self.green_start + green_time
+        if green_end != self.green_end:
+            self.green_end = green_end
+            self._green_token += 1
+            self.schedule(max(self.now, green_end), GREEN_END, self._green_token)
+
+    def handle(self, kind, data):
+        optimizer = self.optimizer
+        if kind == ARRIVAL:
+            queue = self.queues[data]
+            queue.append(self.now)
+            self.max_queue[data] = max(self.max_queue[data], len(queue))
+            self.schedule_next_arrival(data)
+            if self.released(data):
+                self.start_departures(data)
+            if optimizer.current_state == 'green':
+                # The plan weighs every approach, so a vehicle queueing on red moves the green end too
+                self.update_green_end()
+
+        elif kind == DEPARTURE:
+            self.departure_pending[data] = False
+            if not self.released(data) or not self.queues[data]:
+                return
+            self.total_delay[data] += self.now - self.queues[data].popleft()
+            self.served[data] += 1
+            # Saturation flow: the next vehicle can follow one headway later
+            self.next_free[data] = self.now + self.headway
+            self.start_departures(data)
+            self.update_green_end()
+
+        elif kind == GREEN_START:
+            optimizer.current_state = 'green'
+            optimizer.state_start_time = self.now
+            self.green_start = self.now
+            self.green_end = None
+            for approach in self.phases[optimizer.current_phase]:
+                if approach in self.queues:
+                    # Start-up lost time before the first vehicle crosses the stop line
+                    self.next_free[approach] = self.now + self.lost_time
+                    self.start_departures(approach)
+            self.update_green_end()
+
+        elif kind == GREEN_END:
+            if data != self._green_token or optimizer.current_state != 'green':
+                return
+            optimizer.current_state = 'yellow'
+            optimizer.state_start_time = self.now
+            self.schedule(self.now + optimizer.yellow_time, YELLOW_END)
+
+        elif kind == YELLOW_END:
+            optimizer.current_state = 'red'
+            optimizer.state_start_time = self.now
+            optimizer.current_phase = (optimizer.current_phase + 1) % len(self.phases)
+            if optimizer.current_phase == 0:
+                self.cycles += 1
+            self.schedule(self.now + optimizer.all_red_time, GREEN_START)
+
+    def run(self, duration):
+        if not self.events:
+            if self.trace is not None:
+                self.schedule_next_arrival()
+            else:
+                for approach in self.approaches:
+                    self.schedule_next_arrival(approach)
+            self.optimizer.current_state = 'red'
+            self.schedule(self.now + self.optimizer.all_red_time, GREEN_START)
+
+        end = self.now + duration
+        while self.events and self.events[0][0] <= end:
+            self.now, _, kind, data = heapq.heappop(self.events)
+            self.handle(kind, data)
+        self.now = end
+        return self.summary()
+
+    def summary(self):
+        served = sum(self.served.values())
+        delay = sum(self.total_delay.values())
+        return {
+            'time': self.now,
+            'served': served,
+            'avg_delay': delay / served if served else 0.0,
+            'throughput_per_hour': served / self.now * 3600 if self.now else 0.0,
+            'max_queue': max(self.max_queue.values()),
+            'cycles': self.cycles,
+            'approaches': {
+                approach: {
+                    'served': self.served[approach],
+                    'avg_delay': (self.total_delay[approach] / self.served[approach]
+                                  if self.served[approach] else 0.0),
+                    'max_queue': self.max_queue[approach]
+                }
+                for approach in self.approaches
+            }
+        }
+
+def print_summary(label, summary, elapsed):
+    print(f"{label}: served {summary['served']} | avg delay {summary['avg_delay']:.1f}s | "
+          f"throughput {summary['throughput_per_hour']:.0f} veh/h | max queue {summary['max_queue']} | "
+          f"cycles {summary['cycles']} | {elapsed:.3f}s wall")
+
+def main():
+    parser = argparse.ArgumentParser(description="Discrete-event evaluation of the signal controller")
+    parser.add_argument('--duration', type=float, default=3600, help="simulated seconds")
+    parser.add_argument('--rate', type=float, default=0.08, help="arrivals per second per approach")
+    parser.add_argument('--main-rate', type=float, default=None, help="arrival rate on road1/road4")
+    parser.add_argument('--saturation-flow', type=float, default=0.5, help="departures per second when green")
+    parser.add_argument('--lost-time', type=float, default=2.0, help="start-up lost time per green")
+    parser.add_argument('--fixed-green', type=float, default=None,
+                        help="also evaluate fixed timing with this green time")
+    parser.add_argument('--predictive', action='store_true',
+                        help="also evaluate the model-predictive controller")
+    parser.add_argument('--budget-ms', type=float, default=3.0, help="predictive controller compute budget")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rates = {f"{road}_in": args.rate for road in ROADS}
+    if args.main_rate is not None:
+        rates['road1_in'] = rates['road4_in'] = args.main_rate
+
+    policies = [('Adaptive', None, None)]
+    if args.fixed_green is not None:
+        policies.append((f"Fixed {args.fixed_green:g}s", None, args.fixed_green))
+    if args.predictive:
+        from predictive import PredictiveOptimizer
+        optimizer = PredictiveOptimizer(ROADS, start_time=0.0, arrival_rates=rates,
+                                        saturation_flow=args.saturation_flow, lost_time=args.lost_time,
+                                        budget_ms=args.budget_ms)
+        policies.append(('Predictive', optimizer, None))
+    for label, optimizer, fixed_green in policies:
+        sim = QueueSimulation(optimizer=optimizer, arrival_rates=rates, saturation_flow=args.saturation_flow,
+                              lost_time=args.lost_time, fixed_green=fixed_green, seed=args.seed)
+        started = time.time()
+        summary = sim.run(args.duration)
+        print_summary(label, summary, time.time() - started)
+        if optimizer is not None:
+            print(f"  {optimizer.decisions} decisions, {optimizer.fallbacks} fell back to the proportional rule")
+
+if __name__ == "__main__":
+    main()
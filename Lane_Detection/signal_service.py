@@ -0,0 +1,250 @@
+import argparse
+import asyncio
+import os
+import random
+import struct
+import time
+from collections import deque
+
+import numpy as np
+
+from lane_map import LANES
+from video import TrafficLightOptimizer
+
+# Wire format: a one-byte message type followed by a fixed-size little-endian body
+MSG_COUNTS = 1      # camera -> service: intersection, captured_at, left/center/right PCU
+MSG_SUBSCRIBE = 2   # any client -> service: send me STATE messages for this intersection
+MSG_STATE = 3       # service -> subscribers: intersection, active lane, state, remaining,
+                    # left/center/right green, captured_at of the counts behind the decision
+MSG_PREEMPT = 4     # camera -> service: intersection, lane, detected_at; acted on immediately
+BODIES = {
+    MSG_COUNTS: struct.Struct('<Id3f'),
+    MSG_SUBSCRIBE: struct.Struct('<I'),
+    MSG_STATE: struct.Struct('<IBBf3Hd'),
+    MSG_PREEMPT: struct.Struct('<IBd')
+}
+STATE_CODES = ('green', 'yellow', 'red')
+
+def pack(kind, *fields):
+    return bytes((kind,)) + BODIES[kind].pack(*fields)
+
+async def read_message(reader):
+    kind = (await reader.readexactly(1))[0]
+    body = BODIES.get(kind)
+    if body is None:
+        raise ValueError(f"Unknown message type {kind}")
+    return kind, body.unpack(await reader.readexactly(body.size))
+
+class Intersection:
+    def __init__(self):
+        self.optimizer = TrafficLightOptimizer()
+        # Only the newest counts are kept; updates arriving between ticks overwrite each other
+        self.counts = dict.fromkeys(LANES, 0.0)
+        self.counts_at = 0.0
+        self.subscribers = set()
+        self.published = None
+        self.published_at = 0.0
+
+class SignalService:
+    # Hosts one TrafficLightOptimizer per intersection on a single event loop. Camera workers
+    # push counts whenever they have them; the controllers only step on the tick, and state
+    # changes are published to subscribers (plus a periodic refresh of the countdown)
+    def __init__(self, tick=0.1, refresh=1.0, max_buffer=64 * 1024):
+        self.tick = tick
+        self.refresh = refresh
+        # A subscriber with more than this much unsent data misses updates until it catches
+        # up; states are snapshots, so only the newest one matters
+        self.max_buffer = max_buffer
+        self.intersections = {}
+        self.connections = 0
+        self.updates = 0
+        self.decisions = 0
+        self.published = 0
+        self.skipped = 0
+        self.tick_seconds = deque(maxlen=10000)  # recent tick durations
+        self._server = None
+        self._ticker = None
+        self._path = None
+
+    def intersection(self, intersection_id):
+        if intersection_id not in self.intersections:
+            self.intersections[intersection_id] = Intersection()
+        return self.intersections[intersection_id]
+
+    async def handle_connection(self, reader, writer):
+        self.connections += 1
+        subscribed = []
+        try:
+            while True:
+                kind, fields = await read_message(reader)
+                if kind == MSG_COUNTS:
+                    intersection_id, captured_at, *counts = fields
+                    intersection = self.intersection(intersection_id)
+                    intersection.counts = dict(zip(LANES, counts))
+                    intersection.counts_at = captured_at
+                    self.updates += 1
+                elif kind == MSG_SUBSCRIBE:
+                    intersection = self.intersection(fields[0])
+                    intersection.subscribers.add(writer)
+                    subscribed.append(intersection)
+                    self.decide(fields[0], intersection, time.time(), force=True)
+                elif kind == MSG_PREEMPT:
+                    # Not deferred to the tick: the signal starts clearing as soon as we hear.
+                    # detected_at is wall-clock on the wire; the optimizer wants time.monotonic()
+                    intersection_id, lane, detected_at = fields
+                    if lane >= len(LANES):
+                        raise ValueError(f"Unknown lane {lane}")
+                    intersection = self.intersection(intersection_id)
+                    now = time.time()
+                    intersection.optimizer.request_preemption(
+                        LANES[lane], now, time.monotonic() - (now - detected_at))
+                    self.decide(intersection_id, intersection, now, force=True)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ValueError as e:
+            print(f"Dropping connection: {e}")
+        finally:
+            for intersection in subscribed:
+                intersection.subscribers.discard(writer)
+            self.connections -= 1
+            writer.close()
+
+    def decide(self, intersection_id, intersection, now, force=False):
+        # Steps the controller on the newest counts and publishes if the signal changed,
+        # the last publication is older than refresh, or force is set
+        _, remaining, optimal_times = intersection.optimizer.step(intersection.counts, now)
+        self.decisions += 1
+        optimizer = intersection.optimizer
+        state = (LANES.index(optimizer.current_active_lane), STATE_CODES.index(optimizer.current_state))
+        if not force and state == intersection.published and now - intersection.published_at < self.refresh:
+            return
+        intersection.published = state
+        intersection.published_at = now
+        message = pack(MSG_STATE, intersection_id, *state, remaining,
+                       *(int(optimal_times[lane]) for lane in LANES), intersection.counts_at)
+        for writer in intersection.subscribers:
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                self.skipped += 1
+                continue
+            writer.write(message)
+            self.published += 1
+
+    async def run_ticks(self):
+        while True:
+            started = time.perf_counter()
+            now = time.time()
+            for intersection_id, intersection in self.intersections.items():
+                self.decide(intersection_id, intersection, now)
+            self.tick_seconds.append(time.perf_counter() - started)
+            await asyncio.sleep(max(0.0, self.tick - (time.perf_counter() - started)))
+
+    async def start(self, host='127.0.0.1', port=8765, path=None, backlog=1024):
+        # The default backlog of 100 resets connections when a few hundred cameras come up at once
+        self._path = path
+        if path:
+            self._server = await asyncio.start_unix_server(self.handle_connection, path, backlog=backlog)
+        else:
+            self._server = await asyncio.start_server(self.handle_connection, host, port, backlog=backlog)
+        self._ticker = asyncio.ensure_future(self.run_ticks())
+        return self._server
+
+    async def stop(self):
+        self._ticker.cancel()
+        self._server.close()
+        await self._server.wait_closed()
+        if self._path and os.path.exists(self._path):
+            os.unlink(self._path)
+
+class CameraClient:
+    # Stand-in for a camera worker: pushes random lane counts at `rate` Hz and listens for the
+    # intersection's state, recording count-to-state latency from the echoed timestamp
+    def __init__(self, intersection_id, host='127.0.0.1', port=8765, path=None, rate=10.0, seed=0):
+        self.intersection_id = intersection_id
+        self.host = host
+        self.port = port
+        self.path = path
+        self.rate = rate
+        self.rng = random.Random(seed * 1000003 + intersection_id)
+        self.sent = 0
+        self.states = 0
+        self.latencies = []
+
+    async def connect(self):
+        if self.path:
+            return await asyncio.open_unix_connection(self.path)
+        return await asyncio.open_connection(self.host, self.port)
+
+    async def run(self, duration):
+        reader, writer = await self.connect()
+        writer.write(pack(MSG_SUBSCRIBE, self.intersection_id))
+        listener = asyncio.ensure_future(self.listen(reader))
+        counts = [self.rng.uniform(0, 10) for _ in LANES]
+        end = time.time() + duration
+        while time.time() < end:
+            counts = [max(0.0, count + self.rng.gauss(0, 0.5)) for count in counts]
+            writer.write(pack(MSG_COUNTS, self.intersection_id, time.time(), *counts))
+            self.sent += 1
+            await writer.drain()
+            await asyncio.sleep(1 / self.rate * self.rng.uniform(0.5, 1.5))
+        listener.cancel()
+        writer.close()
+
+    async def listen(self, reader):
+        while True:
+            kind, fields = await read_message(reader)
+            if kind == MSG_STATE:
+                self.states += 1
+                counts_at = fields[-1]
+                if counts_at:
+                    self.latencies.append((time.time() - counts_at) * 1000)
+
+async def run_demo(cameras, duration, rate, tick, path=None, port=8765):
+    # Service and all camera clients on one event loop
+    service = SignalService(tick=tick)
+    await service.start(port=port, path=path)
+    clients = [CameraClient(i, port=port, path=path, rate=rate) for i in range(cameras)]
+    started = time.time()
+    await asyncio.gather(*(client.run(duration) for client in clients))
+    elapsed = time.time() - started
+    await service.stop()
+
+    latencies = np.array([latency for client in clients for latency in client.latencies]) if clients else None
+    ticks = np.array(service.tick_seconds) * 1000
+    print(f"Cameras: {cameras} | count messages: {service.updates} ({service.updates / elapsed:.0f}/s) | "
+          f"decisions: {service.decisions}")
+    print(f"Coalesced: {service.updates / max(1, len(ticks) * cameras):.2f} updates per intersection per tick | "
+          f"tick p50 {np.percentile(ticks, 50):.2f} ms, max {ticks.max():.2f} ms")
+    print(f"States published: {service.published} | skipped for slow subscribers: {service.skipped}")
+    if latencies is not None and len(latencies):
+        print(f"Count-to-state latency: p50 {np.percentile(latencies, 50):.0f} ms | "
+              f"p95 {np.percentile(latencies, 95):.0f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Signal controller service for many camera workers")
+    parser.add_argument('mode', choices=['serve', 'demo'],
+                        help="serve: run the service; demo: service plus stand-in camera clients")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None, help="listen on this Unix socket path instead of TCP")
+    parser.add_argument('--tick', type=float, default=0.1, help="decision interval in seconds")
+    parser.add_argument('--cameras', type=int, default=300, help="demo: number of camera clients")
+    parser.add_argument('--rate', type=float, default=10.0, help="demo: count messages per camera per second")
+    parser.add_argument('--duration', type=float, default=10.0, help="demo: seconds to run")
+    args = parser.parse_args()
+
+    if args.mode == 'demo':
+        asyncio.run(run_demo(args.cameras, args.duration, args.rate, args.tick, args.unix, args.port))
+        return
+
+    async def serve():
+        service = SignalService(tick=args.tick)
+        server = await service.start(port=args.port, path=args.unix)
+        print(f"Signal service listening on {args.unix or f'127.0.0.1:{args.port}'}")
+        async with server:
+            await server.serve_forever()
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,21 @@
-import pygame
+import argparse
+import json
 import random
 import math
+import sys
 import time
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+
+from metrics import SimMetrics, print_summary
+from profiling import PhaseTimer, SamplingProfiler, print_phase_summary, print_profile
 
-# Initialize pygame
-pygame.init()
 screen_width, screen_height = 1366, 768
-screen = pygame.display.set_mode((screen_width, screen_height))
-pygame.display.set_caption("6-Way Smart Intersection Simulation with Synchronized Opposite Lanes")
-clock = pygame.time.Clock()
+
+# pygame, the window and fonts are created by init_display() so that importing this
+# module (tests, worker processes, headless runs) doesn't open a window
+pygame = None
+screen = None
+clock = None
 
 # Colors
 BLACK = (0, 0, 0)
@@ -28,25 +34,53 @@ VEHICLE_TYPES = {
     'motorcycle': {'width': 22, 'height': 10, 'color': (255, 255, 100), 'speed': (3.5, 6)}
 }
 
-# Font settings
-FONT_LARGE = pygame.font.SysFont('Arial', 24, bold=True)
-FONT_MEDIUM = pygame.font.SysFont('Arial', 20)
-FONT_SMALL = pygame.font.SysFont('Arial', 16)
+# Font settings (loaded in init_display)
+FONT_LARGE = None
+FONT_MEDIUM = None
+FONT_SMALL = None
+
+def init_display():
+    global pygame, screen, clock, FONT_LARGE, FONT_MEDIUM, FONT_SMALL
+    import pygame
+
+    # Initialize pygame
+    pygame.init()
+    screen = pygame.display.set_mode((screen_width, screen_height))
+    pygame.display.set_caption("6-Way Smart Intersection Simulation with Synchronized Opposite Lanes")
+    clock = pygame.time.Clock()
+
+    FONT_LARGE = pygame.font.SysFont('Arial', 24, bold=True)
+    FONT_MEDIUM = pygame.font.SysFont('Arial', 20)
+    FONT_SMALL = pygame.font.SysFont('Arial', 16)
 
 class TrafficLightOptimizer:
-    def __init__(self, roads):
+    def __init__(self, roads, start_time=None):
+        if start_time is None:
+            start_time = time.time()
         self.roads = roads
         self.min_green_time = 12
         self.max_green_time = 50
         self.yellow_time = 4
+        self.all_red_time = 1.5
         self.current_phase = 0
         self.phases = self.generate_phases()
         self.current_state = 'red'
-        self.state_start_time = time.time()
+        self.state_start_time = start_time
         self.weights = {road: 1.0 for road in roads}
         self.weights['road1'] = 1.3
         self.weights['road4'] = 1.2
         self.optimal_times = {road: self.min_green_time for road in roads}
+        # Timing plans are memoized per phase on counts rounded to count_bucket vehicles
+        self.road_keys = [f"{road}_{direction}" for road in roads for direction in ('in', 'out')]
+        self.count_bucket = 1
+        self.plan_cache_size = 128
+        self._plan_cache = OrderedDict()
+        # Emergency preemption: the phase releasing the emergency approach gets at least
+        # preemption_hold seconds of green; repeat requests within the cooldown are ignored
+        self.preemption_hold = 15
+        self.preemption_cooldown = 30
+        self.preempt_phase = None
+        self.preemption_events = []
         
     def generate_phases(self):
         # Each phase controls opposite directions simultaneously
@@ -74,15 +108,92 @@ class TrafficLightOptimizer:
         
         return green_times
     
-    def update_phase(self, vehicle_counts):
-        current_time = time.time()
+    def get_plan(self, vehicle_counts, now=None):
+        # The returned dict is shared with the cache, so callers must not modify it. now is
+        # unused here; it's for subclasses whose plan depends on how long the phase has run
+        buckets = tuple(round(vehicle_counts.get(road_key, 0) / self.count_bucket)
+                        for road_key in self.road_keys)
+        key = (self.current_phase, buckets, self.min_green_time, self.max_green_time,
+               tuple(self.weights.items()))
+        plan = self._plan_cache.get(key)
+        if plan is not None:
+            self._plan_cache.move_to_end(key)
+            return plan
+
+        plan = self.calculate_optimal_times(
+            {road_key: bucket * self.count_bucket for road_key, bucket in zip(self.road_keys, buckets)})
+        self._plan_cache[key] = plan
+        if len(self._plan_cache) > self.plan_cache_size:
+            self._plan_cache.popitem(last=False)
+        return plan
+
+    def step(self, vehicle_counts, now=None):
+        # Single pass per frame: advance the signal and return (status, seconds remaining in
+        # the current state, timing plan of the active phase)
+        current_time = time.time() if now is None else now
+        status = self.update_phase(vehicle_counts, current_time)
+
+        state_duration = current_time - self.state_start_time
+        if self.current_state == 'green':
+            # Memoized, so this only costs a lookup when the phase has just turned green
+            self.optimal_times = self.get_plan(vehicle_counts, current_time)
+            remaining = self.green_time() - state_duration
+        elif self.current_state == 'yellow':
+            remaining = self.yellow_time - state_duration
+        else:
+            remaining = self.all_red_time - state_duration
+        return status, max(0, remaining), self.optimal_times
+
+    def green_time(self):
+        # Each phase runs for the mean green time of its approaches, or longer when preempted
+        avg_green_time = sum(self.optimal_times.values()) / len(self.optimal_times)
+        if self.preempt_phase == self.current_phase:
+            return max(avg_green_time, self.preemption_hold)
+        return avg_green_time
+
+    def request_preemption(self, road_key, now=None, detected_at=None):
+        # Fast path for an emergency vehicle on road_key: a conflicting green is cut short
+        # through the normal yellow and all-red, then the phase releasing road_key goes green.
+        # detected_at is the time.monotonic() timestamp of the detection, for the latency record
+        current_time = time.time() if now is None else now
+        target = next((p for p, phase in enumerate(self.phases) if road_key in phase), None)
+        if target is None:
+            raise ValueError(f"No phase releases {road_key}")
+        if self.preempt_phase is not None:
+            return False
+        last = self.preemption_events[-1] if self.preemption_events else None
+        if last and last['phase'] == target and current_time - last['requested_at'] < self.preemption_cooldown:
+            return False
+
+        self.preempt_phase = target
+        if self.current_state == 'green' and self.current_phase == target:
+            self.state_start_time = current_time  # already green: hold it from now
+        elif self.current_state == 'green':
+            self.current_state = 'yellow'
+            self.state_start_time = current_time
+        elif self.current_state == 'red':
+            # Still inside the all-red clearance, so the next green can simply be swapped
+            self.current_phase = target
+        signalled_at = time.monotonic()
+        self.preemption_events.append({
+            'phase': target,
+            'road_key': road_key,
+            'requested_at': current_time,
+            'latency_ms': (signalled_at - (detected_at or signalled_at)) * 1000,
+            'green_after': 0.0 if self.current_state == 'green' else None
+        })
+        return True
+
+    def update_phase(self, vehicle_counts, now=None):
+        current_time = time.time() if now is None else now
         state_duration = current_time - self.state_start_time
         
         if self.current_state == 'green':
-            self.optimal_times = self.calculate_optimal_times(vehicle_counts)
-            avg_green_time = sum(self.optimal_times.values()) / len(self.optimal_times)
+            self.optimal_times = self.get_plan(vehicle_counts, current_time)
             
-            if state_duration >= avg_green_time:
+            if state_duration >= self.green_time():
+                if self.preempt_phase == self.current_phase:
+                    self.preempt_phase = None
                 self.current_state = 'yellow'
                 self.state_start_time = current_time
                 return "Switching to YELLOW"
@@ -91,30 +202,42 @@ class TrafficLightOptimizer:
             if state_duration >= self.yellow_time:
                 self.current_state = 'red'
                 self.state_start_time = current_time
-                self.current_phase = (self.current_phase + 1) % len(self.phases)
+                if self.preempt_phase is not None:
+                    self.current_phase = self.preempt_phase
+                else:
+                    self.current_phase = (self.current_phase + 1) % len(self.phases)
                 return f"Switching to PHASE {self.current_phase}"
         
         elif self.current_state == 'red':
-            if state_duration >= 1.5:
+            if state_duration >= self.all_red_time:
                 self.current_state = 'green'
                 self.state_start_time = current_time
+                if self.preempt_phase == self.current_phase:
+                    # A restored or forked controller may not hold the request behind this preemption
+                    event = self.preemption_events[-1] if self.preemption_events else None
+                    if event is not None and event['green_after'] is None:
+                        event['green_after'] = current_time - event['requested_at']
+                    return f"EMERGENCY: PHASE {self.current_phase} GREEN"
                 return f"PHASE {self.current_phase} GREEN"
         
         return f"PHASE {self.current_phase} {self.current_state.upper()}"
 
 class Vehicle:
-    def __init__(self, road, lane, direction):
+    def __init__(self, road, lane, direction, rng=None):
+        # rng is the owning simulation's random.Random, so forked simulations stay independent
+        self.rng = rng or random
         self.road = road
         self.lane = lane  # 0 (left lane) or 1 (right lane)
         self.direction = direction  # 'in' or 'out'
-        self.type = random.choice(list(VEHICLE_TYPES.keys()))
-        self.speed = random.uniform(*VEHICLE_TYPES[self.type]['speed'])
+        self.type = self.rng.choice(list(VEHICLE_TYPES.keys()))
+        self.speed = self.rng.uniform(*VEHICLE_TYPES[self.type]['speed'])
         self.width = VEHICLE_TYPES[self.type]['width']
         self.height = VEHICLE_TYPES[self.type]['height']
         self.color = VEHICLE_TYPES[self.type]['color']
         self.x, self.y = self.get_initial_position()
         self.waiting_time = 0
         self.passed_intersection = False
+        self.finished = False
         
     def get_initial_position(self):
         road_num = int(self.road[-1])
@@ -139,7 +262,7 @@ class Vehicle:
         
         return x, y
     
-    def update(self, optimizer):
+    def update(self, optimizer, recycle=True):
         in_intersection = self.is_in_intersection()
         should_stop = False
         
@@ -156,9 +279,12 @@ class Vehicle:
         if not should_stop:
             self.move_vehicle()
         
-        # Reset if vehicle goes off screen
+        # Reset if vehicle goes off screen (or retire it when demand comes from a trace)
         if self.is_off_screen():
-            self.reset_vehicle()
+            if recycle:
+                self.reset_vehicle()
+            else:
+                self.finished = True
     
     def move_vehicle(self):
         road_num = int(self.road[-1])
@@ -183,9 +309,9 @@ class Vehicle:
     
     def reset_vehicle(self):
         # 50% chance to spawn a new vehicle going the opposite direction
-        if random.random() < 0.5:
+        if self.rng.random() < 0.5:
             self.direction = 'out' if self.direction == 'in' else 'in'
-        self.__init__(self.road, random.randint(0, 1), self.direction)
+        self.__init__(self.road, self.rng.randint(0, 1), self.direction, self.rng)
     
     def draw(self, screen):
         road_num = int(self.road[-1])
@@ -282,25 +408,314 @@ def draw_intersection(screen, optimizer):
                 pygame.draw.circle(screen, BLACK, (int(light_x), int(light_y)), light_size+2)
                 pygame.draw.circle(screen, color, (int(light_x), int(light_y)), light_size)
 
-def main():
+class RandomDemand:
+    # The original spawn rule: occasionally add a random vehicle, and recycle vehicles that
+    # leave the screen back onto their road
+    recycles = True
+    finished = False
+
+    def __init__(self, roads, initial_vehicles=40, max_vehicles=60, spawn_probability=0.02, rng=None):
+        self.roads = roads
+        self.initial_vehicles = initial_vehicles
+        self.max_vehicles = max_vehicles
+        self.spawn_probability = spawn_probability
+        self.rng = rng or random
+
+    def initial(self):
+        return [(self.rng.choice(self.roads), self.rng.choice(['in', 'out'])) for _ in range(self.initial_vehicles)]
+
+    def spawns(self, now, vehicle_count):
+        if self.rng.random() < self.spawn_probability and vehicle_count < self.max_vehicles:
+            return [(self.rng.choice(self.roads), self.rng.choice(['in', 'out']))]
+        return []
+
+    def fork(self, rng):
+        # Stateless apart from the RNG, so a fork is the same generator on the fork's RNG
+        return RandomDemand(self.roads, self.initial_vehicles, self.max_vehicles,
+                            self.spawn_probability, rng)
+
+class Simulation:
+    def __init__(self, demand=None, fps=30, seed=None, populate=True, optimizer=None):
+        self.roads = [f'road{i}' for i in range(1, 7)]
+        self.fps = fps
+        # All randomness comes from this generator, so its state is part of a snapshot
+        self.rng = random.Random(seed)
+        # Signals run on simulation time (frames / fps), so headless runs can go faster than real time
+        self.optimizer = optimizer or TrafficLightOptimizer(self.roads, start_time=0.0)
+        self.demand = demand or RandomDemand(self.roads, rng=self.rng)
+        # populate=False leaves the road empty, for restoring a snapshot into
+        self.vehicles = [Vehicle(road, self.rng.randint(0, 1), direction, self.rng)
+                         for road, direction in (self.demand.initial() if populate else [])]
+        self.simulation_time = 0
+        self.vehicle_counts = defaultdict(int)
+        self.type_counts = defaultdict(lambda: defaultdict(int))
+        self.status = ''
+        self.remaining = 0
+        self.metrics = SimMetrics(self.optimizer.road_keys, len(self.optimizer.phases))
+        # Optional PhaseTimer; step() marks 'count', 'signal', 'update' and 'spawn' on it
+        self.timer = None
+
+    @property
+    def now(self):
+        return self.simulation_time / self.fps
+
+    def step(self):
+        # Update simulation time
+        self.simulation_time += 1
+
+        # Count vehicles for optimization
+        vehicle_counts = defaultdict(int)
+        type_counts = defaultdict(lambda: defaultdict(int))
+
+        for vehicle in self.vehicles:
+            if vehicle.is_in_intersection() and vehicle.direction == 'in':
+                road_key = f"{vehicle.road}_{vehicle.direction}"
+                vehicle_counts[road_key] += 1
+                type_counts[road_key][vehicle.type] += 1
+        self.vehicle_counts = vehicle_counts
+        self.type_counts = type_counts
+        timer = self.timer
+        if timer is not None:
+            timer.mark('count')
+
+        # Update traffic light state
+        self.status, self.remaining, _ = self.optimizer.step(vehicle_counts, self.now)
+        self.metrics.observe(vehicle_counts, self.optimizer, self.now)
+        if timer is not None:
+            timer.mark('signal')
+
+        # Update vehicles
+        recycle = self.demand.recycles
+        for vehicle in self.vehicles:
+            passed = vehicle.passed_intersection
+            vehicle.update(self.optimizer, recycle)
+            if vehicle.passed_intersection and not passed:
+                # Recorded as the vehicle crosses, before reset_vehicle can clear waiting_time
+                self.metrics.record_departure(f"{vehicle.road}_{vehicle.direction}",
+                                              vehicle.waiting_time / self.fps,
+                                              self.optimizer.current_phase)
+        if not recycle:
+            self.vehicles = [vehicle for vehicle in self.vehicles if not vehicle.finished]
+        if timer is not None:
+            timer.mark('update')
+
+        # Add new vehicles
+        for road, direction in self.demand.spawns(self.now, len(self.vehicles)):
+            self.vehicles.append(Vehicle(road, self.rng.randint(0, 1), direction, self.rng))
+        if timer is not None:
+            timer.mark('spawn')
+
+STEP_PHASES = ('count', 'signal', 'update', 'spawn')
+DRAW_PHASES = ('intersection', 'vehicles', 'panel')
+
+def draw_panel(screen, sim):
+    optimizer = sim.optimizer
+
+    # Draw information panel
+    panel_width = 300
+    pygame.draw.rect(screen, (40, 40, 60), (0, 0, panel_width, screen_height))
+    pygame.draw.rect(screen, (80, 80, 100), (0, 0, panel_width, screen_height), 2)
+
+    # Display simulation info - TIMINGS AT THE TOP
+    y_offset = 20
+
+    # Current phase and timing info at the top
+    phase_header = FONT_MEDIUM.render(f"PHASE {optimizer.current_phase}", True, WHITE)
+    screen.blit(phase_header, (20, y_offset))
+    y_offset += 30
+
+    # Show optimal times for current phase
+    times_header = FONT_MEDIUM.render("GREEN TIMES:", True, WHITE)
+    screen.blit(times_header, (20, y_offset))
+    y_offset += 30
+
+    current_phase_roads = optimizer.phases[optimizer.current_phase]
+    for road in current_phase_roads:
+        time_val = optimizer.optimal_times.get(road, 0)
+        time_text = FONT_SMALL.render(f"{road}: {int(time_val)}s", True, GREEN)
+        screen.blit(time_text, (30, y_offset))
+        y_offset += 25
+
+    y_offset += 20
+
+    # Current status
+    status_text = FONT_MEDIUM.render(f"STATUS:", True, WHITE)
+    screen.blit(status_text, (20, y_offset))
+    y_offset += 30
+
+    state_color = GREEN if optimizer.current_state == 'green' else (
+        YELLOW if optimizer.current_state == 'yellow' else RED)
+    state_text = FONT_MEDIUM.render(f"{sim.status}", True, state_color)
+    screen.blit(state_text, (30, y_offset))
+    y_offset += 30
+    remaining_text = FONT_SMALL.render(f"Remaining: {int(sim.remaining)}s", True, state_color)
+    screen.blit(remaining_text, (30, y_offset))
+    y_offset += 30
+
+    # Time
+    time_text = FONT_MEDIUM.render(f"Time: {sim.simulation_time//10}s", True, WHITE)
+    screen.blit(time_text, (20, y_offset))
+    y_offset += 40
+
+    # Vehicle counts header
+    counts_header = FONT_MEDIUM.render("VEHICLE COUNTS:", True, WHITE)
+    screen.blit(counts_header, (20, y_offset))
+    y_offset += 30
+
+    # Vehicle counts per road direction
+    for i, road in enumerate(sim.roads):
+        for direction in ['in', 'out']:
+            road_key = f"{road}_{direction}"
+            count = sim.vehicle_counts.get(road_key, 0)
+            is_active = road_key in optimizer.phases[optimizer.current_phase]
+            road_color = GREEN if is_active and optimizer.current_state == 'green' else WHITE
+
+            dir_text = "ENTERING" if direction == 'in' else "EXITING"
+            road_text = FONT_SMALL.render(f"{road} {dir_text}: {count}", True, road_color)
+            screen.blit(road_text, (30, y_offset))
+            y_offset += 25
+
+            # Vehicle type breakdown
+            for v_type, v_count in sim.type_counts.get(road_key, {}).items():
+                type_text = FONT_SMALL.render(f" - {v_type}: {v_count}", True, VEHICLE_TYPES[v_type]['color'])
+                screen.blit(type_text, (40, y_offset))
+                y_offset += 20
+            y_offset += 5
+
+    # Controls info
+    y_offset = screen_height - 60
+    controls_text = FONT_SMALL.render("SPACE: Pause/Resume", True, WHITE)
+    screen.blit(controls_text, (20, y_offset))
+    y_offset += 25
+    quit_text = FONT_SMALL.render("ESC: Quit", True, WHITE)
+    screen.blit(quit_text, (20, y_offset))
+
+def draw_hud(screen, sim, timer):
+    # Frame-time overlay, top right. Shows the previous frames' rolling means, since the
+    # current frame's draw phases haven't finished yet
+    step_ms = timer.recent_ms(*STEP_PHASES)
+    draw_ms = timer.recent_ms(*DRAW_PHASES)
+    frame_ms = timer.recent_ms(*(name for name in timer.recent if name != 'idle'))
+    lines = [f"Frame {frame_ms:5.1f} ms ({clock.get_fps():4.1f} fps)",
+             f"Step  {step_ms:5.1f} ms", f"Draw  {draw_ms:5.1f} ms",
+             f"Vehicles {len(sim.vehicles)}"]
+    x = screen_width - 220
+    pygame.draw.rect(screen, (40, 40, 60), (x - 10, 10, 220, 20 * len(lines) + 10))
+    for i, line in enumerate(lines):
+        screen.blit(FONT_SMALL.render(line, True, WHITE), (x, 15 + 20 * i))
+
+def run_benchmark(vehicle_counts=(50, 100, 200, 400, 800, 1600), steps=900, warmup=60, seed=0, out=None):
+    # Headless scaling benchmark: a fixed population of recycling vehicles per run, with the
+    # step phases timed. Append the results to a JSON-lines file to track regressions over time
     roads = [f'road{i}' for i in range(1, 7)]
-    optimizer = TrafficLightOptimizer(roads)
-    
-    # Create initial vehicles
-    vehicles = []
-    for _ in range(40):  # Fewer initial vehicles for better visibility
-        road = random.choice(roads)
-        lane = random.randint(0, 1)
-        direction = random.choice(['in', 'out'])
-        vehicles.append(Vehicle(road, lane, direction))
-    
-    # Simulation variables
-    simulation_time = 0
+    print(f"{'Vehicles':>8}{'Steps/s':>10}{'us/step':>10}{'us/veh':>8}" +
+          ''.join(f"{name:>9}" for name in STEP_PHASES))
+    results = []
+    for n in vehicle_counts:
+        demand = RandomDemand(roads, initial_vehicles=n, max_vehicles=n, spawn_probability=0.0,
+                              rng=random.Random(seed))
+        sim = Simulation(demand, seed=seed)
+        for _ in range(warmup):
+            sim.step()
+        timer = sim.timer = PhaseTimer(window=steps)
+        started = time.perf_counter()
+        for _ in range(steps):
+            timer.start()
+            sim.step()
+        elapsed = time.perf_counter() - started
+        summary = timer.summary()
+        result = {'vehicles': n, 'steps_per_sec': steps / elapsed, 'us_per_step': 1e6 * elapsed / steps,
+                  'phase_share': {name: summary[name][3] for name in STEP_PHASES}}
+        results.append(result)
+        print(f"{n:>8}{result['steps_per_sec']:>10.0f}{result['us_per_step']:>10.1f}"
+              f"{result['us_per_step'] / n:>8.2f}" +
+              ''.join(f"{result['phase_share'][name]:>9.1%}" for name in STEP_PHASES))
+    if out:
+        with open(out, 'a') as f:
+            f.write(json.dumps({'time': time.time(), 'python': sys.version.split()[0], 'steps': steps,
+                                'seed': seed, 'results': results}) + '\n')
+    return results
+
+def run_headless(sim, duration=None, report_every=3600, metrics_path=None):
+    # No window and no frame limiter: step as fast as possible until the duration or the trace ends
+    started = time.time()
+    next_report = report_every
+    while (duration is None or sim.now < duration) and not sim.demand.finished:
+        sim.step()
+        if sim.now >= next_report:
+            elapsed = time.time() - started
+            summary = sim.metrics.summary()
+            print(f"Sim time {sim.now / 3600:6.1f}h | vehicles {len(sim.vehicles):4} | "
+                  f"served {summary['served']:6} | avg delay {summary['avg_delay']:5.1f}s | "
+                  f"{sim.now / elapsed:7.0f}x real time")
+            if metrics_path:
+                sim.metrics.export(metrics_path)
+            next_report += report_every
+    print(f"Finished {sim.now:.0f}s of simulated time in {time.time() - started:.1f}s")
+
+def finish_run(sim, metrics_path=None):
+    summary = sim.metrics.summary()
+    print_summary(summary)
+    if metrics_path:
+        sim.metrics.export(metrics_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="6-way smart intersection simulation")
+    parser.add_argument('--fps', type=int, default=30, help="frame rate of the viewer")
+    parser.add_argument('--seed', type=int, default=None, help="random seed for reproducible runs")
+    parser.add_argument('--trace', nargs='+', default=None,
+                        help="count logs (.npy or .csv) to replay as demand, in chronological order")
+    parser.add_argument('--lane-roads', default='left_lane=road1,center=road2,right_lane=road3',
+                        help="which simulated road each recorded lane feeds")
+    parser.add_argument('--trace-scale', type=float, default=1.0, help="multiply replayed demand")
+    parser.add_argument('--trace-fps', type=float, default=30.0,
+                        help="frame rate of the recordings, for CSV logs without a time column")
+    parser.add_argument('--headless', action='store_true', help="run without a window, as fast as possible")
+    parser.add_argument('--duration', type=float, default=None, help="simulated seconds to run headless")
+    parser.add_argument('--predictive', action='store_true',
+                        help="use the model-predictive controller instead of the proportional rule")
+    parser.add_argument('--metrics', default=None,
+                        help="append JSON-line metric summaries here (hourly when headless, and at the end)")
+    parser.add_argument('--hud', action='store_true', help="show frame, step and draw times on screen")
+    parser.add_argument('--profile', default=None,
+                        help="sample the main loop and write collapsed stacks here on exit")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="time headless steps at increasing vehicle counts and exit")
+    parser.add_argument('--bench-vehicles', nargs='+', type=int, default=[50, 100, 200, 400, 800, 1600])
+    parser.add_argument('--bench-steps', type=int, default=900)
+    parser.add_argument('--bench-out', default=None, help="append benchmark results here as a JSON line")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark(args.bench_vehicles, args.bench_steps, seed=args.seed or 0, out=args.bench_out)
+        return
+
+    demand = None
+    if args.trace:
+        from trace_demand import TraceDemand, parse_lane_roads
+        demand = TraceDemand(args.trace, parse_lane_roads(args.lane_roads), scale=args.trace_scale,
+                             fps=args.trace_fps)
+    optimizer = None
+    if args.predictive:
+        from predictive import PredictiveOptimizer
+        optimizer = PredictiveOptimizer([f'road{i}' for i in range(1, 7)], start_time=0.0)
+    sim = Simulation(demand, fps=args.fps, seed=args.seed, optimizer=optimizer)
+    profiler = SamplingProfiler().start() if args.profile else None
+
+    if args.headless:
+        run_headless(sim, args.duration, metrics_path=args.metrics)
+        finish_run(sim, args.metrics)
+        finish_profile(profiler, args.profile)
+        return
+
+    init_display()
     running = True
     paused = False
+    timer = sim.timer = PhaseTimer()
     
     # Main game loop
     while running:
+        timer.start()
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
@@ -315,125 +730,45 @@ def main():
             pause_text = FONT_LARGE.render("PAUSED - Press SPACE to continue", True, WHITE)
             screen.blit(pause_text, (screen_width//2 - 180, screen_height//2))
             pygame.display.flip()
-            clock.tick(30)
+            clock.tick(args.fps)
             continue
         
         # Clear screen
         screen.fill(BLACK)
+        timer.mark('events')
         
-        # Update simulation time
-        simulation_time += 1
-        
-        # Count vehicles for optimization
-        vehicle_counts = defaultdict(int)
-        type_counts = defaultdict(lambda: defaultdict(int))
-        
-        for vehicle in vehicles:
-            if vehicle.is_in_intersection() and vehicle.direction == 'in':
-                road_key = f"{vehicle.road}_{vehicle.direction}"
-                vehicle_counts[road_key] += 1
-                type_counts[road_key][vehicle.type] += 1
-        
-        # Update traffic light state
-        status = optimizer.update_phase(vehicle_counts)
-        
-        # Update vehicles
-        for vehicle in vehicles:
-            vehicle.update(optimizer)
-        
-        # Add new vehicles at controlled rate
-        if random.random() < 0.02 and len(vehicles) < 60:
-            road = random.choice(roads)
-            lane = random.randint(0, 1)
-            direction = random.choice(['in', 'out'])
-            vehicles.append(Vehicle(road, lane, direction))
+        sim.step()
         
         # Draw everything
-        draw_intersection(screen, optimizer)
+        draw_intersection(screen, sim.optimizer)
+        timer.mark('intersection')
         
-        for vehicle in vehicles:
+        for vehicle in sim.vehicles:
             vehicle.draw(screen)
+        timer.mark('vehicles')
         
-        # Draw information panel
-        panel_width = 300
-        pygame.draw.rect(screen, (40, 40, 60), (0, 0, panel_width, screen_height))
-        pygame.draw.rect(screen, (80, 80, 100), (0, 0, panel_width, screen_height), 2)
-        
-        # Display simulation info - TIMINGS AT THE TOP
-        y_offset = 20
-        
-        # Current phase and timing info at the top
-        phase_header = FONT_MEDIUM.render(f"PHASE {optimizer.current_phase}", True, WHITE)
-        screen.blit(phase_header, (20, y_offset))
-        y_offset += 30
-        
-        # Show optimal times for current phase
-        times_header = FONT_MEDIUM.render("GREEN TIMES:", True, WHITE)
-        screen.blit(times_header, (20, y_offset))
-        y_offset += 30
-        
-        current_phase_roads = optimizer.phases[optimizer.current_phase]
-        for road in current_phase_roads:
-            time_val = optimizer.optimal_times.get(road, 0)
-            time_text = FONT_SMALL.render(f"{road}: {int(time_val)}s", True, GREEN)
-            screen.blit(time_text, (30, y_offset))
-            y_offset += 25
-        
-        y_offset += 20
-        
-        # Current status
-        status_text = FONT_MEDIUM.render(f"STATUS:", True, WHITE)
-        screen.blit(status_text, (20, y_offset))
-        y_offset += 30
-        
-        state_color = GREEN if optimizer.current_state == 'green' else (
-            YELLOW if optimizer.current_state == 'yellow' else RED)
-        state_text = FONT_MEDIUM.render(f"{status}", True, state_color)
-        screen.blit(state_text, (30, y_offset))
-        y_offset += 40
-        
-        # Time
-        time_text = FONT_MEDIUM.render(f"Time: {simulation_time//10}s", True, WHITE)
-        screen.blit(time_text, (20, y_offset))
-        y_offset += 40
-        
-        # Vehicle counts header
-        counts_header = FONT_MEDIUM.render("VEHICLE COUNTS:", True, WHITE)
-        screen.blit(counts_header, (20, y_offset))
-        y_offset += 30
-        
-        # Vehicle counts per road direction
-        for i, road in enumerate(roads):
-            for direction in ['in', 'out']:
-                road_key = f"{road}_{direction}"
-                count = vehicle_counts.get(road_key, 0)
-                is_active = road_key in optimizer.phases[optimizer.current_phase]
-                road_color = GREEN if is_active and optimizer.current_state == 'green' else WHITE
-                
-                dir_text = "ENTERING" if direction == 'in' else "EXITING"
-                road_text = FONT_SMALL.render(f"{road} {dir_text}: {count}", True, road_color)
-                screen.blit(road_text, (30, y_offset))
-                y_offset += 25
-                
-                # Vehicle type breakdown
-                for v_type, v_count in type_counts.get(road_key, {}).items():
-                    type_text = FONT_SMALL.render(f" - {v_type}: {v_count}", True, VEHICLE_TYPES[v_type]['color'])
-                    screen.blit(type_text, (40, y_offset))
-                    y_offset += 20
-                y_offset += 5
-        
-        # Controls info
-        y_offset = screen_height - 60
-        controls_text = FONT_SMALL.render("SPACE: Pause/Resume", True, WHITE)
-        screen.blit(controls_text, (20, y_offset))
-        y_offset += 25
-        quit_text = FONT_SMALL.render("ESC: Quit", True, WHITE)
-        screen.blit(quit_text, (20, y_offset))
+        draw_panel(screen, sim)
+        timer.mark('panel')
+        if args.hud:
+            draw_hud(screen, sim, timer)
+            timer.mark('hud')
         
         pygame.display.flip()
-        clock.tick(30)
+        timer.mark('flip')
+        clock.tick(args.fps)
+        timer.mark('idle')
     
     pygame.quit()
+    finish_run(sim, args.metrics)
+    print_phase_summary(timer)
+    finish_profile(profiler, args.profile)
+
+def finish_profile(profiler, path):
+    if profiler is None:
+        return
+    profiler.stop()
+    profiler.dump(path)
+    print_profile(profiler, path)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,139 @@
+import copy
+import struct
+
+import numpy as np
+
+from simulation import VEHICLE_TYPES, Simulation, Vehicle
+
+# Flat binary snapshot of a Simulation:
+#   header | road weights (f8) | timing plan | RNG state (u4) | vehicle records
+SNAPSHOT_MAGIC = b'SIMS'
+SNAPSHOT_VERSION = 2
+HEADER = struct.Struct('<4sHHqIBBBBB7dB')
+NO_PREEMPTION = 255
+STATE_CODES = ('green', 'yellow', 'red')
+DIRECTIONS = ('in', 'out')
+VEHICLE_TYPE_NAMES = list(VEHICLE_TYPES)
+# Mersenne Twister state as returned by random.getstate(): 624 words plus the position
+RNG_WORDS = 625
+
+PLAN_DTYPE = np.dtype([('key', 'u1'), ('green', '<f8')])
+VEHICLE_DTYPE = np.dtype([
+    ('road', 'u1'),
+    ('lane', 'u1'),
+    ('direction', 'u1'),
+    ('type', 'u1'),
+    ('passed', 'u1'),
+    ('finished', 'u1'),
+    ('waiting_time', '<i4'),
+    ('speed', '<f8'),
+    ('x', '<f8'),
+    ('y', '<f8')
+])
+
+def _plan_keys(optimizer):
+    # optimal_times is keyed by road before the first green and by road_key after it
+    return optimizer.road_keys + optimizer.roads
+
+def snapshot(sim):
+    optimizer = sim.optimizer
+    rng_version, words, gauss_next = sim.rng.getstate()
+    plan_keys = {key: i for i, key in enumerate(_plan_keys(optimizer))}
+
+    header = HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_VERSION, sim.fps, sim.simulation_time, len(sim.vehicles),
+        len(optimizer.optimal_times), optimizer.current_phase,
+        STATE_CODES.index(optimizer.current_state),
+        NO_PREEMPTION if optimizer.preempt_phase is None else optimizer.preempt_phase, rng_version,
+        optimizer.state_start_time, sim.remaining, optimizer.min_green_time, optimizer.max_green_time,
+        optimizer.yellow_time, optimizer.all_red_time,
+        0.0 if gauss_next is None else gauss_next, gauss_next is not None)
+
+    weights = np.array([optimizer.weights.get(road, 1.0) for road in optimizer.roads], dtype='<f8')
+    plan = np.array([(plan_keys[key], green) for key, green in optimizer.optimal_times.items()],
+                    dtype=PLAN_DTYPE)
+    state = np.array(words, dtype='<u4')
+
+    vehicles = np.empty(len(sim.vehicles), dtype=VEHICLE_DTYPE)
+    for i, v in enumerate(sim.vehicles):
+        vehicles[i] = (int(v.road[-1]), v.lane, DIRECTIONS.index(v.direction),
+                       VEHICLE_TYPE_NAMES.index(v.type), v.passed_intersection, v.finished,
+                       v.waiting_time, v.speed, v.x, v.y)
+    return b''.join((header, weights.tobytes(), plan.tobytes(), state.tobytes(), vehicles.tobytes()))
+
+def _make_vehicle(row, rng):
+    # Rebuilds a Vehicle without calling __init__, which would draw from the RNG
+    road, lane, direction, type_index, passed, finished, waiting_time, speed, x, y = row
+    vehicle = Vehicle.__new__(Vehicle)
+    vehicle.rng = rng
+    vehicle.road = f"road{road}"
+    vehicle.lane = lane
+    vehicle.direction = DIRECTIONS[direction]
+    vehicle.type = VEHICLE_TYPE_NAMES[type_index]
+    properties = VEHICLE_TYPES[vehicle.type]
+    vehicle.width = properties['width']
+    vehicle.height = properties['height']
+    vehicle.color = properties['color']
+    vehicle.speed = speed
+    vehicle.x = x
+    vehicle.y = y
+    vehicle.waiting_time = waiting_time
+    vehicle.passed_intersection = bool(passed)
+    vehicle.finished = bool(finished)
+    return vehicle
+
+def restore(data, demand=None, optimizer=None):
+    # demand defaults to a fresh RandomDemand on the restored RNG; a trace-driven run must
+    # pass its own demand source, since the trace position isn't part of the snapshot.
+    # optimizer (e.g. a PredictiveOptimizer) receives the saved signal state
+    (magic, version, fps, simulation_time, n_vehicles, n_plan, current_phase, state_code,
+     preempt_phase, rng_version, state_start_time, remaining, min_green_time, max_green_time, yellow_time,
+     all_red_time, gauss_next, has_gauss) = HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError("Not a simulation snapshot, or written by an incompatible version")
+
+    sim = Simulation(demand, fps=fps, populate=False, optimizer=optimizer)
+    optimizer = sim.optimizer
+    offset = HEADER.size
+    weights = np.frombuffer(data, '<f8', len(optimizer.roads), offset)
+    offset += weights.nbytes
+    plan = np.frombuffer(data, PLAN_DTYPE, n_plan, offset)
+    offset += plan.nbytes
+    words = np.frombuffer(data, '<u4', RNG_WORDS, offset)
+    offset += words.nbytes
+    vehicles = np.frombuffer(data, VEHICLE_DTYPE, n_vehicles, offset)
+
+    sim.rng.setstate((rng_version, tuple(words.tolist()), gauss_next if has_gauss else None))
+    sim.simulation_time = simulation_time
+    sim.remaining = remaining
+    optimizer.current_phase = current_phase
+    optimizer.current_state = STATE_CODES[state_code]
+    optimizer.state_start_time = state_start_time
+    optimizer.preempt_phase = None if preempt_phase == NO_PREEMPTION else preempt_phase
+    optimizer.min_green_time = min_green_time
+    optimizer.max_green_time = max_green_time
+    optimizer.yellow_time = yellow_time
+    optimizer.all_red_time = all_red_time
+    optimizer.weights = dict(zip(optimizer.roads, weights.tolist()))
+    plan_keys = _plan_keys(optimizer)
+    optimizer.optimal_times = {plan_keys[key]: green for key, green in plan.tolist()}
+    sim.vehicles = [_make_vehicle(row, sim.rng) for row in vehicles.tolist()]
+    return sim
+
+def fork(sim, demand=None):
+    # In-memory branch of a running simulation. The fork gets its own copy of the RNG,
+    # vehicles and signal state, and starts with empty metrics so a rollout measures only
+    # what happens after the branch point
+    if demand is None and not hasattr(sim.demand, 'fork'):
+        raise ValueError(f"{type(sim.demand).__name__} can't be forked; pass demand= explicitly")
+    # A shallow copy keeps the controller type and configuration. Plans are a pure function of
+    # their key, so the memo it still shares with the original is safe to share
+    optimizer = copy.copy(sim.optimizer)
+    # Past events stay with the original, but a preemption in progress carries over so the
+    # branch can record when its phase turns green (and keeps honouring the cooldown)
+    events = sim.optimizer.preemption_events
+    optimizer.preemption_events = [dict(events[-1])] if events and sim.optimizer.preempt_phase is not None else []
+    branch = restore(snapshot(sim), demand, optimizer)
+    if demand is None:
+        branch.demand = sim.demand.fork(branch.rng)
+    return branch
@@ -0,0 +1,231 @@
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing as mp
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from lane_map import LANES, load_lane_polygons
+from video import (FRAME_SIZE, VEHICLE_PCU, load_model, detect_vehicles, class_ids, pcu_table,
+                   count_lanes, make_lane_map, update_lane_geometry)
+
+class YoloDetector:
+    def __init__(self, model_name):
+        self.model = load_model(model_name)
+        self.names = self.model.names
+
+    def __call__(self, frame, conf_threshold, classes, imgsz):
+        return detect_vehicles(self.model, frame, conf_threshold, classes, imgsz)
+
+class StubDetector:
+    # Stand-in for YOLO that needs neither ultralytics nor torch, for exercising the harness.
+    # Boxes are derived from the frame content, so every configuration sees the same scene;
+    # smaller models, smaller inputs and higher thresholds miss more of them and run faster
+    names = {0: 'car', 1: 'motorcycle', 2: 'bus', 3: 'truck'}
+    # Relative cost and recall by the size letter in yolov8{n,s,m,l,x}.pt
+    SIZES = {'n': (1.0, 0.80), 's': (2.5, 0.87), 'm': (6.0, 0.92), 'l': (10.0, 0.95), 'x': (16.0, 0.97)}
+
+    def __init__(self, model_name, base_ms=2.0):
+        letter = model_name.split('.')[0][-1]
+        self.cost, self.recall = self.SIZES.get(letter, self.SIZES['n'])
+        self.base_ms = base_ms
+
+    def __call__(self, frame, conf_threshold, classes, imgsz):
+        scale = (imgsz or 640) / 640
+        time.sleep(self.base_ms * self.cost * scale * scale / 1000)
+        rng = np.random.default_rng(int(frame[::32, ::32].sum()))
+        n = rng.integers(0, 12)
+        x1 = rng.uniform(0, FRAME_SIZE[0] - 120, n)
+        y1 = rng.uniform(FRAME_SIZE[1] / 2, FRAME_SIZE[1] - 80, n)
+        boxes = np.column_stack([x1, y1, x1 + rng.uniform(40, 120, n), y1 + rng.uniform(30, 80, n),
+                                 rng.uniform(0, 1, n) * min(1.0, self.recall * scale ** 0.25) + 0.2,
+                                 rng.integers(0, len(self.names), n)]).astype(np.float32)
+        keep = boxes[:, 4] >= conf_threshold
+        if classes is not None:
+            keep &= np.isin(boxes[:, 5], classes)
+        return boxes[keep]
+
+def make_detector(model_name, stub=False):
+    return StubDetector(model_name) if stub else YoloDetector(model_name)
+
+def run_config(config, sources, lane_polygons=None, lane_refresh=30, stub=False):
+    # Runs in a fresh process per configuration, so ru_maxrss is this configuration's peak
+    detector = make_detector(config['model'], stub)
+    vehicle_classes = class_ids(detector.names, VEHICLE_PCU)
+    pcu_weights = pcu_table(detector.names)
+    skip = config['frame_skip']
+
+    counts = []
+    latencies = []
+    frames = 0
+    started = time.perf_counter()
+    for source in sources:
+        cap = cv2.VideoCapture(source)
+        lane_map = make_lane_map(lane_polygons)
+        lane_lines = None
+        clip_counts = []
+        last = [0.0] * len(LANES)
+        frame_index = 0
+        while True:
+            if frame_index % skip:
+                # Skipped frames are grabbed but not decoded; the controller keeps the last counts
+                if not cap.grab():
+                    break
+                clip_counts.append(last)
+                frame_index += 1
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame_started = time.perf_counter()
+            resized_frame = cv2.resize(frame, FRAME_SIZE)
+            if lane_polygons is None and frame_index % lane_refresh == 0:
+                lane_lines = update_lane_geometry(lane_map, resized_frame, lane_lines)
+            detections = detector(resized_frame, config['conf'], vehicle_classes, config['imgsz'])
+            lane_counts = count_lanes(detections, pcu_weights, lane_map)
+            last = [lane_counts[lane] for lane in LANES]
+            latencies.append((time.perf_counter() - frame_started) * 1000)
+            clip_counts.append(last)
+            frame_index += 1
+        cap.release()
+        frames += frame_index
+        counts.append(np.array(clip_counts, dtype=np.float32).reshape(-1, len(LANES)))
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array(latencies) if latencies else np.zeros(1)
+    result = dict(config)
+    result.update({
+        'frames': frames,
+        'processed': len(latencies),
+        'fps': frames / elapsed if elapsed else 0.0,
+        'latency_p50_ms': float(np.percentile(latencies, 50)),
+        'latency_p95_ms': float(np.percentile(latencies, 95)),
+        'latency_p99_ms': float(np.percentile(latencies, 99)),
+        # Linux reports ru_maxrss in KiB
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    })
+    return result, counts
+
+def run_isolated(config, sources, lane_polygons=None, lane_refresh=30, stub=False):
+    # spawn, not fork: a forked child would start with the parent's memory high-water mark
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context('spawn')) as pool:
+        return pool.submit(run_config, config, sources, lane_polygons, lane_refresh, stub).result()
+
+def load_labels(path, fps):
+    # Ground-truth lane counts (PCU) for some or all frames, as (frame indices, (m, 3) counts).
+    # Accepts batch.py --csv output or a count log written with --count-log
+    if path.endswith('.npy'):
+        log = np.load(path)
+        frames = np.rint(log['time'] * fps).astype(np.intp)
+        counts = np.column_stack([log[field] for field in ('left_count', 'center_count', 'right_count')])
+        return frames, counts.astype(np.float32)
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    frames = np.array([int(row['frame']) for row in rows], dtype=np.intp)
+    counts = np.array([[float(row[field]) for field in ('left_count', 'center_count', 'right_count')]
+                       for row in rows], dtype=np.float32).reshape(-1, len(LANES))
+    return frames, counts
+
+def lane_count_mae(counts, labels):
+    errors = []
+    for predicted, (frames, truth) in zip(counts, labels):
+        valid = frames < len(predicted)
+        errors.append(np.abs(predicted[frames[valid]] - truth[valid]))
+    errors = np.concatenate(errors) if errors else np.zeros((0, len(LANES)))
+    return float(errors.mean()) if errors.size else float('nan')
+
+def pareto_front(results, objectives=(('mae', 'min'), ('fps', 'max'))):
+    # A configuration is kept unless another one is at least as good on every objective
+    # and strictly better on one
+    def score(result):
+        return [result[key] if sense == 'min' else -result[key] for key, sense in objectives]
+
+    scores = [score(result) for result in results]
+    front = []
+    for i, a in enumerate(scores):
+        dominated = any(all(x <= y for x, y in zip(b, a)) and any(x < y for x, y in zip(b, a))
+                        for j, b in enumerate(scores) if j != i)
+        if not dominated:
+            front.append(results[i])
+    return front
+
+def sweep(clips, models, imgsz_values, conf_values, frame_skips, lane_polygons=None, lane_refresh=30,
+          reference=None, stub=False):
+    # clips: [(video path, labels path or None)]. Unlabelled clips are scored against the
+    # reference configuration (by default the largest model at the largest input size)
+    sources = [source for source, _ in clips]
+    fps_of = []
+    for source in sources:
+        cap = cv2.VideoCapture(source)
+        fps_of.append(cap.get(cv2.CAP_PROP_FPS) or 30.0)
+        cap.release()
+    labels = [load_labels(path, fps) if path else None for (_, path), fps in zip(clips, fps_of)]
+
+    if any(label is None for label in labels):
+        reference = reference or {'model': models[-1], 'imgsz': max(imgsz_values, key=lambda v: v or 0),
+                                  'conf': min(conf_values), 'frame_skip': 1}
+        print(f"Labelling {sum(label is None for label in labels)} clip(s) with reference {reference}")
+        _, reference_counts = run_isolated(reference, sources, lane_polygons, lane_refresh, stub)
+        labels = [label if label is not None else (np.arange(len(counts)), counts)
+                  for label, counts in zip(labels, reference_counts)]
+
+    results = []
+    grid = list(itertools.product(models, imgsz_values, conf_values, frame_skips))
+    for i, (model, imgsz, conf, frame_skip) in enumerate(grid, 1):
+        config = {'model': model, 'imgsz': imgsz, 'conf': conf, 'frame_skip': frame_skip}
+        result, counts = run_isolated(config, sources, lane_polygons, lane_refresh, stub)
+        result['mae'] = lane_count_mae(counts, labels)
+        results.append(result)
+        print(f"[{i}/{len(grid)}] {format_config(result)} | {result['fps']:6.1f} fps | "
+              f"MAE {result['mae']:.3f}")
+    return results
+
+def format_config(result):
+    return (f"{result['model']} imgsz={result['imgsz'] or 'default'} conf={result['conf']:g} "
+            f"skip={result['frame_skip']}")
+
+def print_results(results, front):
+    front_ids = {id(result) for result in front}
+    print("\nPareto | Configuration                               |    FPS | p50 ms | p95 ms | p99 ms | "
+          "RSS MB |   MAE")
+    for result in sorted(results, key=lambda r: -r['fps']):
+        mark = '*' if id(result) in front_ids else ' '
+        print(f"  {mark}    | {format_config(result):43} | {result['fps']:6.1f} | "
+              f"{result['latency_p50_ms']:6.1f} | {result['latency_p95_ms']:6.1f} | "
+              f"{result['latency_p99_ms']:6.1f} | {result['peak_rss_mb']:6.0f} | {result['mae']:5.3f}")
+
+def parse_clip(spec):
+    # 'video.mp4' or 'video.mp4=labels.csv'
+    source, _, labels = spec.partition('=')
+    return source, labels or None
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuracy vs throughput sweep over detector settings")
+    parser.add_argument('clips', nargs='+', help="video files, optionally as video=labels.csv")
+    parser.add_argument('--models', nargs='+', default=['yolov8n.pt'])
+    parser.add_argument('--imgsz', nargs='+', type=int, default=[640])
+    parser.add_argument('--conf', nargs='+', type=float, default=[0.5])
+    parser.add_argument('--frame-skip', nargs='+', type=int, default=[1],
+                        help="run detection on every Nth frame")
+    parser.add_argument('--lanes', default=None, help="JSON file of lane polygons")
+    parser.add_argument('--lane-refresh', type=int, default=30)
+    parser.add_argument('--stub', action='store_true', help="use the stub detector instead of YOLO")
+    parser.add_argument('--out', default=None, help="write all results and the Pareto front as JSON")
+    args = parser.parse_args()
+
+    lane_polygons = load_lane_polygons(args.lanes) if args.lanes else None
+    results = sweep([parse_clip(spec) for spec in args.clips], args.models, args.imgsz, args.conf,
+                    args.frame_skip, lane_polygons, args.lane_refresh, stub=args.stub)
+    front = pareto_front(results)
+    print_results(results, front)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'results': results, 'pareto': front}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import cv2
+import pytest
+
+# The modules import each other as top-level scripts (e.g. `from simulation import ...`)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video import FRAME_SIZE
+
+@pytest.fixture
+def write_clip(tmp_path):
+    # Writes frames to an MJPG clip in tmp_path and returns its path. MJPG ships with every
+    # OpenCV build, so the clips don't depend on system codecs
+    def write(frames, name='clip.avi', fps=25.0):
+        path = str(tmp_path / name)
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, FRAME_SIZE)
+        for frame in frames:
+            writer.write(frame)
+        writer.release()
+        return path
+    return write
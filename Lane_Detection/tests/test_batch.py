@@ -0,0 +1,55 @@
+import cv2
+import numpy as np
+import pytest
+
+import batch
+from batch import plan_segments, process_segment, replay_optimizer
+from video import FRAME_SIZE
+
+class FakeBoxes:
+    def __init__(self, data):
+        self.data = self
+        self._data = data
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self._data
+
+class FakeModel:
+    # Same boxes for every frame, spread across the width so lane assignment decides the counts
+    names = {0: 'car', 1: 'truck'}
+
+    def __call__(self, frame, conf=0.25, classes=None, verbose=False):
+        x1 = np.arange(40, 1240, 100, dtype=np.float32)
+        boxes = np.column_stack([x1, np.full_like(x1, 560), x1 + 60, np.full_like(x1, 640),
+                                 np.full_like(x1, 0.9), (x1 // 100) % 2]).astype(np.float32)
+        return [type('Result', (), {'boxes': FakeBoxes(boxes)})()]
+
+def drifting_lanes(i):
+    # Lane markings that drift every frame; every 7th frame has none, so refits there fail
+    # and the previous geometry must stay in effect
+    frame = np.full((FRAME_SIZE[1], FRAME_SIZE[0], 3), 40, dtype=np.uint8)
+    if i % 7:
+        shift = 4 * i
+        cv2.line(frame, (160 + shift, 720), (560 + shift, 400), (255, 255, 255), 12)
+        cv2.line(frame, (1120 + shift, 720), (720 + shift, 400), (255, 255, 255), 12)
+    return frame
+
+@pytest.fixture
+def clip(write_clip):
+    return write_clip(drifting_lanes(i) for i in range(100))
+
+def test_segments_match_serial_run_with_fitted_lanes(clip, monkeypatch):
+    monkeypatch.setattr(batch, '_worker_model', FakeModel())
+    serial = process_segment(clip, 0, None, 0.5, lane_refresh=10)
+    segments = [process_segment(clip, start, end, 0.5, lane_refresh=10)
+                for start, end in plan_segments(100, 37)]
+    assert np.array_equal(np.concatenate(segments), serial)
+
+def test_replay_uses_given_times():
+    counts = np.zeros((3, 4), dtype=np.float32)
+    counts[:, 3] = -1
+    output = replay_optimizer(counts, np.array([0.0, 0.04, 10.0]))
+    assert [row['time'] for row in output] == [0.0, 0.04, 10.0]
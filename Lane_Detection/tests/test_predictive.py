@@ -0,0 +1,25 @@
+from predictive import PredictiveOptimizer
+
+ROADS = [f'road{i}' for i in range(1, 7)]
+COUNTS = {'road1_in': 6, 'road2_in': 1, 'road3_in': 4, 'road4_in': 2}
+
+def test_default_budget_plans_instead_of_falling_back():
+    optimizer = PredictiveOptimizer(ROADS, start_time=0.0)
+    for elapsed in range(0, 40, 2):
+        optimizer.decide(COUNTS, float(elapsed))
+    # An idle machine scores the coarse grid well inside 3 ms; allow the odd scheduler hiccup
+    assert optimizer.decisions == 20
+    assert optimizer.fallbacks <= 2
+
+def test_stale_slow_estimate_recovers():
+    optimizer = PredictiveOptimizer(ROADS, start_time=0.0)
+    # As if one chunk had once taken a whole second
+    optimizer._chunk_average = optimizer._chunk_seconds = 1.0
+    assert optimizer.decide(COUNTS) == optimizer.calculate_optimal_times(
+        {road_key: COUNTS.get(road_key, 0) for road_key in optimizer.road_keys})
+    for _ in range(200):
+        optimizer.decide(COUNTS)
+    fallbacks = optimizer.fallbacks
+    for _ in range(10):
+        optimizer.decide(COUNTS)
+    assert optimizer.fallbacks - fallbacks <= 1
@@ -0,0 +1,27 @@
+import pytest
+
+from video import TrafficLightOptimizer
+
+COUNTS = {'left_lane': 4, 'center': 2, 'right_lane': 1}
+
+def test_unknown_lane_is_rejected_before_any_state_changes():
+    optimizer = TrafficLightOptimizer(start_time=0.0)
+    optimizer.step(COUNTS, 1.0)
+    before = (optimizer.current_state, optimizer.current_active_lane, optimizer.state_start_time)
+    with pytest.raises(ValueError):
+        optimizer.request_preemption('left', now=2.0)
+    assert optimizer.preempt_lane is None
+    assert not optimizer.preemption_events
+    assert (optimizer.current_state, optimizer.current_active_lane, optimizer.state_start_time) == before
+    # The controller keeps stepping normally afterwards
+    optimizer.step(COUNTS, 3.0)
+
+def test_preempted_lane_gets_green_through_yellow():
+    optimizer = TrafficLightOptimizer(start_time=0.0)
+    optimizer.step(COUNTS, 1.0)
+    assert optimizer.current_active_lane != 'right_lane'
+    assert optimizer.request_preemption('right_lane', now=2.0)
+    assert optimizer.current_state == 'yellow'
+    for now in range(3, 10):
+        optimizer.step(COUNTS, float(now))
+    assert (optimizer.current_state, optimizer.current_active_lane) == ('green', 'right_lane')
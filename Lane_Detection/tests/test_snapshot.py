@@ -0,0 +1,43 @@
+import pytest
+
+from simulation import Simulation, TrafficLightOptimizer
+from snapshot import fork, restore, snapshot
+
+def preempted_sim():
+    sim = Simulation(seed=1)
+    for _ in range(600):
+        sim.step()
+    assert sim.optimizer.request_preemption('road3_in', now=sim.now)
+    return sim
+
+def test_fork_during_preemption_reaches_green():
+    sim = preempted_sim()
+    branch = fork(sim)
+    target = branch.optimizer.preempt_phase
+    for _ in range(30 * 60):
+        branch.step()
+    # The branch ran through the preempted green and recorded it on the carried-over event
+    assert branch.optimizer.preempt_phase is None
+    assert branch.optimizer.preemption_events[-1]['phase'] == target
+    assert branch.optimizer.preemption_events[-1]['green_after'] is not None
+    assert sim.optimizer.preemption_events[-1]['green_after'] is None
+
+def test_restore_during_preemption_steps_without_event():
+    restored = restore(snapshot(preempted_sim()))
+    assert restored.optimizer.preemption_events == []
+    for _ in range(30 * 60):
+        restored.step()
+    assert restored.optimizer.preempt_phase is None
+
+def test_fork_matches_original_during_preemption():
+    sim = preempted_sim()
+    branch = fork(sim)
+    for _ in range(30 * 60):
+        sim.step()
+        branch.step()
+    assert snapshot(branch) == snapshot(sim)
+
+def test_preemption_for_unknown_road_raises():
+    optimizer = TrafficLightOptimizer([f'road{i}' for i in range(1, 7)], start_time=0.0)
+    with pytest.raises(ValueError):
+        optimizer.request_preemption('road9_in', now=0.0)
@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+import pytest
+
+from lane_map import LANES
+from sweep import StubDetector, lane_count_mae, pareto_front, run_config
+from video import FRAME_SIZE, fit_lane_lines
+
+LANE_POLYGONS = {
+    'left_lane': [[0, 360], [426, 360], [426, 720], [0, 720]],
+    'center': [[426, 360], [853, 360], [853, 720], [426, 720]],
+    'right_lane': [[853, 360], [1280, 360], [1280, 720], [853, 720]]
+}
+
+def road_frame(i):
+    # Dark road with two converging lane markings and a car-sized block moving across
+    frame = np.full((FRAME_SIZE[1], FRAME_SIZE[0], 3), 40, dtype=np.uint8)
+    cv2.line(frame, (160, 720), (560, 400), (255, 255, 255), 12)
+    cv2.line(frame, (1120, 720), (720, 400), (255, 255, 255), 12)
+    x = 100 + 20 * i
+    cv2.rectangle(frame, (x, 500), (x + 120, 580), (0, 0, 200), -1)
+    return frame
+
+@pytest.fixture
+def clip(write_clip):
+    return write_clip(road_frame(i) for i in range(12))
+
+def test_run_config_with_stub_detector(clip):
+    config = {'model': 'yolov8n.pt', 'imgsz': 320, 'conf': 0.5, 'frame_skip': 2}
+    result, counts = run_config(config, [clip], LANE_POLYGONS, stub=True)
+    assert result['frames'] == 12
+    assert result['processed'] == 6
+    assert result['fps'] > 0
+    assert result['latency_p50_ms'] <= result['latency_p99_ms']
+    assert len(counts) == 1 and counts[0].shape == (12, len(LANES))
+    # Skipped frames hold the last processed counts
+    assert np.array_equal(counts[0][1::2], counts[0][0::2])
+
+def test_stub_detector_is_deterministic():
+    detector = StubDetector('yolov8s.pt', base_ms=0.0)
+    frame = road_frame(3)
+    first = detector(frame, 0.5, None, 640)
+    assert np.array_equal(first, detector(frame, 0.5, None, 640))
+    assert (first[:, 4] >= 0.5).all()
+
+def test_lane_count_mae():
+    predicted = [np.array([[1, 2, 3], [2, 2, 2], [0, 0, 0]], dtype=np.float32)]
+    labels = [(np.array([0, 2, 5]), np.array([[1, 2, 4], [1, 1, 1], [9, 9, 9]], dtype=np.float32))]
+    # Frame 5 is past the end of the clip and ignored: errors are (0, 0, 1) and (1, 1, 1)
+    assert lane_count_mae(predicted, labels) == pytest.approx(4 / 6)
+
+def test_pareto_front():
+    results = [
+        {'name': 'fast', 'mae': 0.9, 'fps': 60.0},
+        {'name': 'accurate', 'mae': 0.2, 'fps': 10.0},
+        {'name': 'balanced', 'mae': 0.4, 'fps': 30.0},
+        {'name': 'dominated', 'mae': 0.5, 'fps': 25.0},
+        {'name': 'tied', 'mae': 0.9, 'fps': 60.0}
+    ]
+    front = pareto_front(results)
+    assert [result['name'] for result in front] == ['fast', 'accurate', 'balanced', 'tied']
+
+def test_fit_lane_lines_finds_both_markings():
+    left_line, right_line = fit_lane_lines(road_frame(0))
+    assert left_line is not None and right_line is not None
+    # Converging markings: the left one leans right going up the frame, the right one left
+    assert left_line[2] > left_line[0] and right_line[2] < right_line[0]
@@ -0,0 +1,26 @@
+import csv
+
+import numpy as np
+
+from trace_demand import iter_traces, write_count_log
+
+def make_rows(n):
+    return [{'frame': i, 'left_count': 1.0, 'center_count': 2.0, 'right_count': 3.0,
+             'left_green': 10, 'center_green': 10, 'right_green': 10} for i in range(n)]
+
+def test_chained_npy_logs_continue_one_frame_later(tmp_path):
+    path = str(tmp_path / 'day.npy')
+    write_count_log(path, make_rows(50), fps=25.0)
+    times = np.concatenate([chunk['time'] for chunk in iter_traces([path, path], chunk_rows=7, fps=25.0)])
+    assert len(times) == 100
+    assert np.allclose(np.diff(times), 1 / 25)
+
+def test_csv_logs_use_the_recording_fps(tmp_path):
+    path = str(tmp_path / 'day.csv')
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(make_rows(1)[0]))
+        writer.writeheader()
+        writer.writerows(make_rows(50))
+    times = np.concatenate([chunk['time'] for chunk in iter_traces([path, path], fps=29.97)])
+    assert np.isclose(times[49], 49 / 29.97)
+    assert np.allclose(np.diff(times), 1 / 29.97)
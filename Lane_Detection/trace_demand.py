@@ -0,0 +1,127 @@
+import csv
+
+import numpy as np
+
+from lane_map import LANES
+
+# On-disk count log: one row per processed frame, fixed width so it can be memory-mapped
+COUNT_LOG_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('left_count', '<f4'),
+    ('center_count', '<f4'),
+    ('right_count', '<f4'),
+    ('left_green', '<i2'),
+    ('center_green', '<i2'),
+    ('right_green', '<i2')
+])
+COUNT_FIELDS = ('left_count', 'center_count', 'right_count')
+
+def write_count_log(path, output_data, fps):
+    # output_data rows as returned by process_video / process_recordings; rows that carry a
+    # 'time' (chained recordings) keep it, the rest are timed from their frame index
+    log = np.zeros(len(output_data), dtype=COUNT_LOG_DTYPE)
+    log['time'] = [row['time'] if 'time' in row else row['frame'] / fps for row in output_data]
+    for field in COUNT_LOG_DTYPE.names[1:]:
+        log[field] = [row[field] for row in output_data]
+    np.save(path, log)
+
+def iter_count_log(path, chunk_rows=1 << 16, fps=30.0):
+    # Yields the log in fixed-size structured chunks, so multi-day logs never load whole
+    if path.endswith('.npy'):
+        log = np.load(path, mmap_mode='r')
+        for start in range(0, len(log), chunk_rows):
+            yield np.array(log[start:start + chunk_rows])
+        return
+
+    # CSV as written by batch.py --csv: rows carry a time, or in older files only a frame
+    # index, which is converted at the recording's fps
+    with open(path, newline='') as f:
+        rows = []
+        for row in csv.DictReader(f):
+            time = float(row['time']) if row.get('time') else int(row['frame']) / fps
+            rows.append((time,) + tuple(float(row[name]) for name in COUNT_LOG_DTYPE.names[1:]))
+            if len(rows) == chunk_rows:
+                yield np.array(rows, dtype=COUNT_LOG_DTYPE)
+                rows = []
+        if rows:
+            yield np.array(rows, dtype=COUNT_LOG_DTYPE)
+
+def iter_traces(paths, chunk_rows=1 << 16, fps=30.0):
+    # Consecutive logs (e.g. one per day) are chained onto one timeline, each starting one
+    # frame interval after the previous one's last row
+    offset = 0.0
+    for path in paths:
+        end = offset - 1 / fps
+        frame_interval = 1 / fps
+        for chunk in iter_count_log(path, chunk_rows, fps):
+            if len(chunk) == 0:
+                continue
+            chunk['time'] += offset
+            times = np.r_[end, chunk['time']]
+            end = times[-1]
+            if len(times) > 2:
+                frame_interval = times[-1] - times[-2]
+            yield chunk
+        offset = end + frame_interval
+
+def iter_lane_seconds(chunks):
+    # Mean count per lane for every whole second of the trace, computed per chunk with reduceat
+    current_second = None
+    current_sum = None
+    current_n = 0
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        seconds = np.floor(chunk['time']).astype(np.int64)
+        counts = np.column_stack([chunk[field] for field in COUNT_FIELDS]).astype(np.float64)
+        starts = np.flatnonzero(np.r_[True, seconds[1:] != seconds[:-1]])
+        sums = np.add.reduceat(counts, starts, axis=0)
+        sizes = np.diff(np.r_[starts, len(seconds)])
+        for second, lane_sum, n in zip(seconds[starts], sums, sizes):
+            if second == current_second:
+                current_sum += lane_sum
+                current_n += n
+                continue
+            if current_second is not None:
+                yield current_second, current_sum / current_n
+            current_second, current_sum, current_n = second, lane_sum, n
+    if current_second is not None:
+        yield current_second, current_sum / current_n
+
+def parse_lane_roads(spec):
+    # 'left_lane=road1,center=road2,right_lane=road3'
+    lane_roads = dict(item.split('=') for item in spec.split(','))
+    return [lane_roads[lane] for lane in LANES]
+
+class TraceDemand:
+    # Replays recorded per-lane counts as vehicle arrivals. A lane's count is a standing count,
+    # so arrivals are estimated from its increases between consecutive one-second means
+    recycles = False
+
+    def __init__(self, paths, lane_roads, scale=1.0, chunk_rows=1 << 16, fps=30.0):
+        # fps is the recording's frame rate, for CSV logs that only carry frame indices
+        self.lane_roads = lane_roads
+        self.scale = scale
+        self._seconds = iter_lane_seconds(iter_traces(paths, chunk_rows, fps))
+        self._next = next(self._seconds, None)
+        self._previous = None
+        self._pending = np.zeros(len(lane_roads))
+        self.finished = self._next is None
+
+    def initial(self):
+        return []
+
+    def spawns(self, now, vehicle_count):
+        while self._next is not None and self._next[0] <= now:
+            means = self._next[1]
+            if self._previous is not None:
+                self._pending += np.maximum(means - self._previous, 0) * self.scale
+            self._previous = means
+            self._next = next(self._seconds, None)
+        self.finished = self._next is None
+
+        whole = np.floor(self._pending)
+        if not whole.any():
+            return []
+        self._pending -= whole
+        return [(road, 'in') for road, n in zip(self.lane_roads, whole.astype(int)) for _ in range(n)]
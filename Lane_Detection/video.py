@@ -1,14 +1,38 @@
-
-
+import argparse
 import cv2
 import numpy as np
 import math
 import time
-from ultralytics import YOLO
 import os
+import threading
+from collections import OrderedDict
+
+from calibration import GroundTracker, load_calibration, queue_lengths
+from capture import LatestFrameGrabber, is_live_source
+from detection_cache import DetectionCache
+from lane_map import LANES, LaneLabelMap, load_lane_polygons, unpack_lane_lines
+from trace_demand import write_count_log
+
+FRAME_SIZE = (1280, 720)
+
+# COCO vehicle classes counted at the junction, with passenger-car-unit (PCU) weights
+# (typical urban values; tune per site)
+VEHICLE_PCU = {
+    'car': 1.0,
+    'motorcycle': 0.5,
+    'bicycle': 0.5,
+    'bus': 3.0,
+    'truck': 3.0
+}
+
+# Classes that trigger signal preemption. COCO has none of these, so they only fire with a
+# custom-trained model (or use an external detector, see process_video)
+EMERGENCY_CLASSES = ('ambulance', 'fire truck', 'fire_truck', 'police car', 'police_car')
 
 class TrafficLightOptimizer:
-    def __init__(self):
+    def __init__(self, start_time=None):
+        if start_time is None:
+            start_time = time.time()
         self.lane_weights = {
             'left_lane': 1.0,
             'center': 1.2,
@@ -19,10 +43,22 @@ class TrafficLightOptimizer:
         self.yellow_time = 3
         self.current_cycle = 0
         self.history = []
-        self.last_light_change = time.time()
+        self.last_light_change = start_time
         self.current_active_lane = 'left_lane'
         self.current_state = 'green'
-        self.state_start_time = time.time()
+        self.state_start_time = start_time
+        # Timing plans are memoized on counts rounded to count_bucket (0.5 PCU = exact)
+        self.count_bucket = 0.5
+        self.plan_cache_size = 128
+        self._plan_cache = OrderedDict()
+        # Emergency preemption: the requested lane gets at least preemption_hold seconds of
+        # green. The lock lets a detector thread preempt while the main loop is stepping
+        self.preemption_hold = 15
+        # A vehicle stays in view for a while; ignore repeat requests for the same lane
+        self.preemption_cooldown = 30
+        self.preempt_lane = None
+        self.preemption_events = []
+        self._lock = threading.Lock()
         
     def calculate_optimal_times(self, lane_counts):
         weighted_counts = {
@@ -42,14 +78,87 @@ class TrafficLightOptimizer:
         
         return green_times
     
-    def get_next_state(self, lane_counts):
-        current_time = time.time()
+    def get_plan(self, lane_counts):
+        # The returned dict is shared with the cache, so callers must not modify it
+        lanes = tuple(lane_counts)
+        buckets = tuple(round(lane_counts[lane] / self.count_bucket) for lane in lanes)
+        key = (lanes, buckets, self.min_green_time, self.max_green_time,
+               tuple(self.lane_weights.items()))
+        plan = self._plan_cache.get(key)
+        if plan is not None:
+            self._plan_cache.move_to_end(key)
+            return plan
+
+        plan = self.calculate_optimal_times(
+            {lane: bucket * self.count_bucket for lane, bucket in zip(lanes, buckets)})
+        self._plan_cache[key] = plan
+        if len(self._plan_cache) > self.plan_cache_size:
+            self._plan_cache.popitem(last=False)
+        return plan
+
+    def step(self, lane_counts, now=None):
+        # Single pass per frame: advance the signal and return (status, seconds remaining in
+        # the current state, timing plan) without recomputing the plan for display
+        current_time = time.time() if now is None else now
+        optimal_times = self.get_plan(lane_counts)
+        with self._lock:
+            status = self._advance(optimal_times, current_time)
+
+            state_duration = current_time - self.state_start_time
+            if self.current_state == 'green':
+                remaining = self._green_time(optimal_times) - state_duration
+            elif self.current_state == 'yellow':
+                remaining = self.yellow_time - state_duration
+            else:
+                remaining = 0
+        return status, max(0, remaining), optimal_times
+
+    def request_preemption(self, lane, now=None, detected_at=None):
+        # Fast path for an emergency vehicle approaching in `lane`: acts on the signal at once
+        # instead of waiting for the next step(). Another lane's green is cut short through the
+        # normal yellow, so the transition stays safe. detected_at is the time.monotonic()
+        # timestamp of the frame the vehicle was seen in, for the latency record
+        if lane not in self.lane_weights:
+            raise ValueError(f"Unknown lane {lane}")
+        current_time = time.time() if now is None else now
+        with self._lock:
+            if self.preempt_lane is not None:
+                return False  # one preemption at a time; the active one runs to completion
+            last = self.preemption_events[-1] if self.preemption_events else None
+            if last and last['lane'] == lane and current_time - last['requested_at'] < self.preemption_cooldown:
+                return False
+            self.preempt_lane = lane
+            if self.current_state == 'green' and self.current_active_lane == lane:
+                self.state_start_time = current_time  # already green: hold it from now
+            elif self.current_state == 'green':
+                self.current_state = 'yellow'
+                self.state_start_time = current_time
+            elif self.current_state == 'red':
+                self.current_active_lane = lane
+            signalled_at = time.monotonic()
+            self.preemption_events.append({
+                'lane': lane,
+                'requested_at': current_time,
+                'latency_ms': (signalled_at - (detected_at or signalled_at)) * 1000,
+                'green_after': 0.0 if self.current_state == 'green' else None
+            })
+        return True
+
+    def _green_time(self, optimal_times):
+        if self.preempt_lane == self.current_active_lane:
+            return max(optimal_times[self.current_active_lane], self.preemption_hold)
+        return optimal_times[self.current_active_lane]
+
+    def get_next_state(self, lane_counts, now=None):
+        return self.step(lane_counts, now)[0]
+
+    def _advance(self, optimal_times, current_time):
         state_duration = current_time - self.state_start_time
         
-        optimal_times = self.calculate_optimal_times(lane_counts)
-        
         if self.current_state == 'green':
-            if state_duration >= optimal_times[self.current_active_lane]:
+            if state_duration >= self._green_time(optimal_times):
+                if self.preempt_lane == self.current_active_lane:
+                    self.preempt_lane = None
                 self.current_state = 'yellow'
                 self.state_start_time = current_time
                 return f"{self.current_active_lane} switching to yellow"
@@ -57,7 +166,9 @@ class TrafficLightOptimizer:
         elif self.current_state == 'yellow':
             if state_duration >= self.yellow_time:
                 self.current_state = 'red'
-                if self.current_active_lane == 'left_lane':
+                if self.preempt_lane is not None:
+                    self.current_active_lane = self.preempt_lane
+                elif self.current_active_lane == 'left_lane':
                     self.current_active_lane = 'center'
                 elif self.current_active_lane == 'center':
                     self.current_active_lane = 'right_lane'
@@ -69,9 +180,16 @@ class TrafficLightOptimizer:
         elif self.current_state == 'red':
             self.current_state = 'green'
             self.state_start_time = current_time
+            if self.preempt_lane == self.current_active_lane:
+                event = self.preemption_events[-1] if self.preemption_events else None
+                if event is not None and event['green_after'] is None:
+                    event['green_after'] = current_time - event['requested_at']
+                return f"EMERGENCY: {self.current_active_lane} green for {self._green_time(optimal_times)}s"
             return f"{self.current_active_lane} now green for {optimal_times[self.current_active_lane]}s"
         
-        return f"{self.current_active_lane} {self.current_state} ({int(optimal_times[self.current_active_lane] - state_duration)}s remaining)"
+        if self.preempt_lane is not None:
+            return f"EMERGENCY: preempting for {self.preempt_lane} ({self.current_active_lane} {self.current_state})"
+        return f"{self.current_active_lane} {self.current_state} ({int(self._green_time(optimal_times) - state_duration)}s remaining)"
 
 def region_of_interest(img, vertices):
     mask = np.zeros_like(img)
@@ -93,7 +211,9 @@ def draw_lane_lines(img, left_line, right_line, color=[0, 0, 0], thickness=10):
     img = cv2.addWeighted(img, 0.8, line_img, 0.5, 0.0)
     return img
 
-def pipeline(image):
+def fit_lane_lines(image):
+    # Returns (left_line, right_line) as [x_start, max_y, x_end, min_y]; a side is None if
+    # no segment supported it, and the whole result is None if Hough found nothing
     height = image.shape[0]
     width = image.shape[1]
     region_of_interest_vertices = [
@@ -126,157 +246,431 @@ def pipeline(image):
     right_line_y = []
 
     if lines is None:
-        return image
-
-    for line in lines:
-        for x1, y1, x2, y2 in line:
-            slope = (y2 - y1) / (x2 - x1) if (x2 - x1) != 0 else 0
-            if math.fabs(slope) < 0.5:
-                continue
-            if slope <= 0:
-                left_line_x.extend([x1, x2])
-                left_line_y.extend([y1, y2])
-            else:
-                right_line_x.extend([x1, x2])
-                right_line_y.extend([y1, y2])
+        return None
+
+    # (N, 1, 4) in OpenCV 4, (N, 4) in OpenCV 5
+    for x1, y1, x2, y2 in lines.reshape(-1, 4):
+        slope = (y2 - y1) / (x2 - x1) if (x2 - x1) != 0 else 0
+        if math.fabs(slope) < 0.5:
+            continue
+        if slope <= 0:
+            left_line_x.extend([x1, x2])
+            left_line_y.extend([y1, y2])
+        else:
+            right_line_x.extend([x1, x2])
+            right_line_y.extend([y1, y2])
 
     min_y = int(image.shape[0] * (3 / 5))
     max_y = image.shape[0]
 
+    left_line = None
     if left_line_x and left_line_y:
         poly_left = np.poly1d(np.polyfit(left_line_y, left_line_x, deg=1))
-        left_x_start = int(poly_left(max_y))
-        left_x_end = int(poly_left(min_y))
-    else:
-        left_x_start, left_x_end = 0, 0
+        left_line = [int(poly_left(max_y)), max_y, int(poly_left(min_y)), min_y]
 
+    right_line = None
     if right_line_x and right_line_y:
         poly_right = np.poly1d(np.polyfit(right_line_y, right_line_x, deg=1))
-        right_x_start = int(poly_right(max_y))
-        right_x_end = int(poly_right(min_y))
-    else:
-        right_x_start, right_x_end = 0, 0
+        right_line = [int(poly_right(max_y)), max_y, int(poly_right(min_y)), min_y]
+
+    return left_line, right_line
 
+def pipeline(image, lane_lines=None):
+    if lane_lines is None:
+        lane_lines = fit_lane_lines(image)
+    if lane_lines is None:
+        return image
+
+    min_y = int(image.shape[0] * (3 / 5))
+    max_y = image.shape[0]
+    left_line, right_line = lane_lines
     lane_image = draw_lane_lines(
         image,
-        [left_x_start, max_y, left_x_end, min_y],
-        [right_x_start, max_y, right_x_end, min_y]
+        left_line or [0, max_y, 0, min_y],
+        right_line or [0, max_y, 0, min_y]
     )
 
     return lane_image
 
+def update_lane_geometry(lane_map, image, lane_lines):
+    # Keep the last good fit when Hough misses a side, otherwise the map would flicker
+    fitted = fit_lane_lines(image)
+    if fitted is not None and None not in fitted:
+        lane_lines = fitted
+        lane_map.update(lane_lines)
+    return lane_lines
+
 def estimate_distance(bbox_width):
     focal_length = 1000
     known_width = 2.0
     distance = (known_width * focal_length) / bbox_width
     return distance
 
-def process_video():
-    model = YOLO('yolov8n.pt')
-    cap = cv2.VideoCapture('D:/NextNiche Hackathon/TestF/Lane_Detection/video/car2.mp4')
-    
-    if not cap.isOpened():
-        print("Error: Unable to open video file.")
+def load_model(model_name='yolov8n.pt', warmup=True):
+    # ultralytics pulls in torch, so it is only imported once a model is actually needed
+    from ultralytics import YOLO
+    model = YOLO(model_name)
+    if warmup:
+        warm_up_model(model)
+    return model
+
+def warm_up_model(model, runs=2):
+    # The first inferences pay for weight transfer, kernel selection and allocations;
+    # run them on a blank frame so the first real frame is served at steady-state speed
+    dummy = np.zeros((FRAME_SIZE[1], FRAME_SIZE[0], 3), dtype=np.uint8)
+    for _ in range(runs):
+        model(dummy, verbose=False)
+
+def print_latency_summary(latencies):
+    if not latencies:
         return
+    latencies = np.array(latencies)
+    print(f"\nCapture-to-decision latency: p50 {np.percentile(latencies, 50):.1f} ms | "
+          f"p95 {np.percentile(latencies, 95):.1f} ms | max {latencies.max():.1f} ms")
+
+def detect_vehicles(model, frame, conf_threshold=0.5, classes=None, imgsz=None):
+    # One row per box: x1, y1, x2, y2, confidence, class id. Passing the class ids lets
+    # YOLO drop every other class before NMS instead of after post-processing. imgsz
+    # overrides the model's inference resolution (smaller is faster, less accurate)
+    options = {} if imgsz is None else {'imgsz': imgsz}
+    result = model(frame, conf=conf_threshold, classes=classes, verbose=False, **options)[0]
+    return result.boxes.data.cpu().numpy().astype(np.float32)
+
+def class_ids(names, wanted):
+    # names is the model's {id: name} dict, or a plain list when read back from the cache
+    items = names.items() if isinstance(names, dict) else enumerate(names)
+    return [i for i, name in items if name in wanted]
+
+def pcu_table(names):
+    # PCU weight indexed by class id; classes that aren't vehicles weigh nothing
+    items = names.items() if isinstance(names, dict) else enumerate(names)
+    table = np.zeros(len(names), dtype=np.float32)
+    for i, name in items:
+        table[i] = VEHICLE_PCU.get(name, 0.0)
+    return table
+
+def emergency_lane(detections, emergency_ids, lane_map):
+    # Lane of the first emergency vehicle in the frame, or None
+    if not emergency_ids or len(detections) == 0:
+        return None
+    rows = detections[np.isin(detections[:, 5].astype(np.intp), emergency_ids)]
+    for lane_id in lane_map.assign(rows):
+        if lane_id < len(LANES):
+            return LANES[lane_id]
+    return None
+
+def print_preemption_summary(events):
+    if not events:
+        return
+    latencies = np.array([event['latency_ms'] for event in events])
+    to_green = [event['green_after'] for event in events if event['green_after'] is not None]
+    print(f"\nEmergency preemptions: {len(events)} | detection-to-signal latency p50 "
+          f"{np.percentile(latencies, 50):.1f} ms, max {latencies.max():.1f} ms | "
+          f"max time to green {max(to_green, default=0):.1f}s")
+
+def count_lanes(detections, pcu_weights, lane_map):
+    weights = pcu_weights[detections[:, 5].astype(np.intp)]
+    counts = lane_map.count(lane_map.assign(detections), weights)
+    return {lane: round(float(count), 2) for lane, count in zip(LANES, counts)}
+
+def draw_detections(lane_frame, detections, names, ground=None, speeds=None):
+    # With a calibration, ground/speeds come from measure_ground(); otherwise the distance
+    # is guessed from the box width
+    for i, (x1, y1, x2, y2, conf, cls) in enumerate(detections):
+        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+        cv2.rectangle(lane_frame, (x1, y1), (x2, y2), (0, 255, 255), 2)
+        cv2.putText(lane_frame, f'{names[int(cls)].capitalize()} {conf:.2f}', (x1, y1 - 10),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
+
+        if ground is None:
+            label = f'{estimate_distance(x2 - x1):.2f}m'
+        elif np.isnan(speeds[i]):
+            label = f'{ground[i, 1]:.1f}m'
+        else:
+            label = f'{ground[i, 1]:.1f}m {speeds[i] * 3.6:.0f}km/h'
+        cv2.putText(lane_frame, label, (x1, y2 + 20),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
+
+def measure_ground(ground_plane, tracker, detections, lane_map, now):
+    # Calibrated replacement for estimate_distance: every box's road-plane position (m) in
+    # one projection, speeds (m/s) from frame-to-frame tracking, and queue length per lane (m)
+    ground = ground_plane.ground_points(detections)
+    _, speeds = tracker.update(ground, now)
+    return ground, speeds, queue_lengths(ground, speeds, lane_map.assign(detections))
+
+def make_output_row(frame_count, lane_counts, optimal_times, status, latency_ms=None, queues=None):
+    row = {
+        'frame': frame_count,
+        'left_count': lane_counts['left_lane'],
+        'center_count': lane_counts['center'],
+        'right_count': lane_counts['right_lane'],
+        'left_green': optimal_times['left_lane'],
+        'center_green': optimal_times['center'],
+        'right_green': optimal_times['right_lane'],
+        'current_status': status,
+        'latency_ms': latency_ms
+    }
+    if queues is not None:
+        row.update({'left_queue_m': queues['left_lane'], 'center_queue_m': queues['center'],
+                    'right_queue_m': queues['right_lane']})
+    return row
+
+def make_lane_map(lane_polygons=None):
+    lane_map = LaneLabelMap(FRAME_SIZE)
+    if lane_polygons is not None:
+        lane_map.set_polygons(lane_polygons)
+    return lane_map
+
+def replay_detections(cache, optimizer=None, lane_polygons=None, emergency_classes=EMERGENCY_CLASSES,
+                      ground_plane=None):
+    # Cache hit: no decoding and no inference, only lane counting and the controller
+    if optimizer is None:
+        optimizer = TrafficLightOptimizer(start_time=0.0)
+    pcu_weights = pcu_table(cache.meta['names'])
+    emergency_ids = class_ids(cache.meta['names'], emergency_classes)
+    fps = cache.meta['fps']
+    lane_map = make_lane_map(lane_polygons)
+    tracker = GroundTracker() if ground_plane is not None else None
+
+    output_data = []
+    for frame_count in range(len(cache)):
+        if lane_polygons is None:
+            lane_map.update(unpack_lane_lines(cache.get_lane_lines(frame_count)))
+        detections = cache.get(frame_count)
+        lane = emergency_lane(detections, emergency_ids, lane_map)
+        if lane is not None:
+            optimizer.request_preemption(lane, now=frame_count / fps)
+        lane_counts = count_lanes(detections, pcu_weights, lane_map)
+        queues = None
+        if tracker is not None:
+            _, _, queues = measure_ground(ground_plane, tracker, detections, lane_map, frame_count / fps)
+        status, _, optimal_times = optimizer.step(lane_counts, now=frame_count / fps)
+        output_data.append(make_output_row(frame_count, lane_counts, optimal_times, status, queues=queues))
+    return output_data
+
+def process_video(source, live=None, output='frames', output_dir='output',
+                  model_name='yolov8n.pt', warmup=True, conf_threshold=0.5,
+                  cache_dir=None, optimizer=None, lane_polygons=None, lane_refresh=30,
+                  count_log=None, emergency_classes=EMERGENCY_CLASSES, emergency_detector=None,
+                  ground_plane=None):
+    # emergency_detector is an optional callable(frame) -> lane name or None (a dedicated
+    # model, a strobe detector, a V2X feed...). It runs on every captured frame, including
+    # frames the live grabber drops, and preempts the signal without waiting for inference.
+    # ground_plane (see calibration.py) adds road-plane distances, speeds and queue lengths
+    if live is None:
+        live = is_live_source(source)
+
+    cache = None
+    if cache_dir and not live:
+        cache = DetectionCache(cache_dir, source, model_name, conf_threshold, FRAME_SIZE,
+                               sorted(set(VEHICLE_PCU) | set(emergency_classes)))
+        if cache.load():
+            print(f"Using cached detections from {cache.path}")
+            output_data = replay_detections(cache, optimizer, lane_polygons, emergency_classes, ground_plane)
+            if count_log:
+                write_count_log(count_log, output_data, cache.meta['fps'])
+            print_results(output_data)
+            return output_data
+
+    model = load_model(model_name, warmup)
+    emergency_ids = class_ids(model.names, emergency_classes)
+    vehicle_classes = class_ids(model.names, VEHICLE_PCU) + emergency_ids
+    pcu_weights = pcu_table(model.names)
+    annotate = output == 'frames'
+
+    if optimizer is None:
+        optimizer = TrafficLightOptimizer(start_time=None if live else 0.0)
+
+    def check_emergency(frame, captured_at, now=None):
+        lane = emergency_detector(cv2.resize(frame, FRAME_SIZE))
+        if lane is not None:
+            optimizer.request_preemption(lane, now=now, detected_at=captured_at)
+
+    if live:
+        # Live feeds: a grabber thread keeps only the newest frame so decisions never lag behind
+        grabber = LatestFrameGrabber(source, on_frame=check_emergency if emergency_detector else None).start()
+        started = time.monotonic()
+    else:
+        cap = cv2.VideoCapture(source)
+        if not cap.isOpened():
+            print("Error: Unable to open video file.")
+            return
+        # Offline the controller runs on video time so cached and fresh runs agree
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
 
     # Create output directory if it doesn't exist
-    os.makedirs('output', exist_ok=True)
+    if annotate:
+        os.makedirs(output_dir, exist_ok=True)
 
-    optimizer = TrafficLightOptimizer()
     frame_count = 0
     output_data = []
-
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        resized_frame = cv2.resize(frame, (1280, 720))
-        height, width = resized_frame.shape[:2]
-        lane_frame = pipeline(resized_frame)
-
-        lane_counts = {
-            'left_lane': 0,
-            'center': 0,
-            'right_lane': 0
-        }
-
-        results = model(resized_frame)
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                conf = box.conf[0]
-                cls = int(box.cls[0])
-
-                if model.names[cls] == 'car' and conf >= 0.5:
-                    car_center_x = (x1 + x2) / 2
-                    if car_center_x < width / 3:
-                        current_lane = 'left_lane'
-                    elif car_center_x > 2 * width / 3:
-                        current_lane = 'right_lane'
-                    else:
-                        current_lane = 'center'
-                    
-                    lane_counts[current_lane] += 1
-
-                    cv2.rectangle(lane_frame, (x1, y1), (x2, y2), (0, 255, 255), 2)
-                    cv2.putText(lane_frame, f'Car {conf:.2f}', (x1, y1 - 10),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
-
-                    distance = estimate_distance(x2 - x1)
-                    cv2.putText(lane_frame, f'{distance:.2f}m', (x1, y2 + 20),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
-
-        status = optimizer.get_next_state(lane_counts)
-        optimal_times = optimizer.calculate_optimal_times(lane_counts)
-
-        # Display traffic information
-        cv2.putText(lane_frame, f"Left Lane: {lane_counts['left_lane']} cars", (20, 40),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        cv2.putText(lane_frame, f"Center Lane: {lane_counts['center']} cars", (20, 70),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        cv2.putText(lane_frame, f"Right Lane: {lane_counts['right_lane']} cars", (20, 100),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-
-        cv2.putText(lane_frame, f"Current: {status}", (20, 150),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
-
-        cv2.putText(lane_frame, "Optimal Green Times:", (width - 350, 40),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        cv2.putText(lane_frame, f"Left: {optimal_times['left_lane']}s", (width - 350, 70),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        cv2.putText(lane_frame, f"Center: {optimal_times['center']}s", (width - 350, 100),
+    latencies = []
+    finished = False
+    # Lanes come from configured polygons, or from pipeline()'s line fit refreshed every
+    # lane_refresh frames; the label map itself is only rebuilt when the geometry moves
+    lane_map = make_lane_map(lane_polygons)
+    lane_lines = None
+    tracker = GroundTracker() if ground_plane is not None else None
+    ground = speeds = queues = None
+
+    try:
+        while live or cap.isOpened():
+            if live:
+                ret, frame, captured_at = grabber.read(timeout=5.0)
+                if not ret:
+                    print("Waiting for live stream...")
+                    continue
+            else:
+                ret, frame = cap.read()
+                if not ret:
+                    finished = True
+                    break
+                captured_at = time.monotonic()
+                if emergency_detector is not None:
+                    check_emergency(frame, captured_at, now=frame_count / fps)
+
+            resized_frame = cv2.resize(frame, FRAME_SIZE)
+            if lane_polygons is None and frame_count % lane_refresh == 0:
+                lane_lines = update_lane_geometry(lane_map, resized_frame, lane_lines)
+
+            detections = detect_vehicles(model, resized_frame, conf_threshold, vehicle_classes)
+            now = None if live else frame_count / fps
+            # Preempt straight after inference, ahead of counting, caching and annotation
+            lane = emergency_lane(detections, emergency_ids, lane_map)
+            if lane is not None:
+                optimizer.request_preemption(lane, now=now, detected_at=captured_at)
+            if cache is not None:
+                cache.append(detections, lane_lines)
+            lane_counts = count_lanes(detections, pcu_weights, lane_map)
+            if tracker is not None:
+                ground, speeds, queues = measure_ground(ground_plane, tracker, detections, lane_map,
+                                                        captured_at if live else now)
+
+            status, _, optimal_times = optimizer.step(lane_counts, now=now)
+
+            latency_ms = None
+            if live:
+                latency_ms = (time.monotonic() - captured_at) * 1000
+                latencies.append(latency_ms)
+
+            output_data.append(make_output_row(frame_count, lane_counts, optimal_times, status, latency_ms,
+                                               queues))
+            frame_count += 1
+
+            if annotate:
+                lane_frame = pipeline(resized_frame, lane_lines)
+                draw_detections(lane_frame, detections, model.names, ground, speeds)
+                draw_traffic_info(lane_frame, lane_counts, optimal_times, status, latency_ms, queues)
+                cv2.imwrite(os.path.join(output_dir, 'frame_.jpg'), lane_frame)
+
+            # Control processing speed without waitKey
+            if not live:
+                time.sleep(0.03)  # ~30fps
+    except KeyboardInterrupt:
+        print("Stopped by user.")
+    finally:
+        if live:
+            grabber.stop()
+        else:
+            cap.release()
+
+    print_preemption_summary(optimizer.preemption_events)
+    if live:
+        print_latency_summary(latencies)
+        print(f"Dropped stale frames: {grabber.dropped_frames} | Reconnects: {grabber.reconnects}")
+        # Frames are spread over wall time, so logs record the average processed rate
+        fps = frame_count / max(time.monotonic() - started, 1e-6)
+    if count_log and output_data:
+        write_count_log(count_log, output_data, fps)
+    if cache is not None:
+        names = [model.names[i] for i in range(len(model.names))]
+        cache.save(names, fps, complete=finished)
+
+    print_results(output_data)
+    return output_data
+
+def draw_traffic_info(lane_frame, lane_counts, optimal_times, status, latency_ms=None, queues=None):
+    width = lane_frame.shape[1]
+    if latency_ms is not None:
+        cv2.putText(lane_frame, f"Latency: {latency_ms:.0f} ms", (20, 190),
                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        cv2.putText(lane_frame, f"Right: {optimal_times['right_lane']}s", (width - 350, 130),
+    if queues is not None:
+        cv2.putText(lane_frame, f"Queues: L {queues['left_lane']:.0f} m | C {queues['center']:.0f} m | "
+                   f"R {queues['right_lane']:.0f} m", (20, 220),
                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
 
-        output_data.append({
-            'frame': frame_count,
-            'left_count': lane_counts['left_lane'],
-            'center_count': lane_counts['center'],
-            'right_count': lane_counts['right_lane'],
-            'left_green': optimal_times['left_lane'],
-            'center_green': optimal_times['center'],
-            'right_green': optimal_times['right_lane'],
-            'current_status': status
-        })
-
-        cv2.imwrite(f'output/frame_.jpg', lane_frame)
-        frame_count += 1
-
-        # Control processing speed without waitKey
-        time.sleep(0.03)  # ~30fps
-
-    cap.release()
-    
+    # Display traffic information
+    cv2.putText(lane_frame, f"Left Lane: {lane_counts['left_lane']:g} PCU", (20, 40),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    cv2.putText(lane_frame, f"Center Lane: {lane_counts['center']:g} PCU", (20, 70),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    cv2.putText(lane_frame, f"Right Lane: {lane_counts['right_lane']:g} PCU", (20, 100),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+
+    cv2.putText(lane_frame, f"Current: {status}", (20, 150),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
+
+    cv2.putText(lane_frame, "Optimal Green Times:", (width - 350, 40),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    cv2.putText(lane_frame, f"Left: {optimal_times['left_lane']}s", (width - 350, 70),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    cv2.putText(lane_frame, f"Center: {optimal_times['center']}s", (width - 350, 100),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    cv2.putText(lane_frame, f"Right: {optimal_times['right_lane']}s", (width - 350, 130),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+
+def print_results(output_data):
     print("\nTraffic Light Optimization Results:")
-    print("Frame | Left (Count/Time) | Center (Count/Time) | Right (Count/Time) | Status")
+    print("Frame | Left (PCU/Time) | Center (PCU/Time) | Right (PCU/Time) | Status")
     for data in output_data[-10:]:
         print(f"{data['frame']:5} | "
-              f"{data['left_count']:3} / {data['left_green']:3}s | "
-              f"{data['center_count']:3} / {data['center_green']:3}s | "
-              f"{data['right_count']:3} / {data['right_green']:3}s | "
+              f"{data['left_count']:5.1f} / {data['left_green']:3}s | "
+              f"{data['center_count']:5.1f} / {data['center_green']:3}s | "
+              f"{data['right_count']:5.1f} / {data['right_green']:3}s | "
               f"{data['current_status']}")
-
-process_video()
\ No newline at end of file
+    if output_data and 'left_queue_m' in output_data[0]:
+        peaks = {key: max(data[key] for data in output_data)
+                 for key in ('left_queue_m', 'center_queue_m', 'right_queue_m')}
+        print(f"Longest queues: left {peaks['left_queue_m']:.1f} m | center {peaks['center_queue_m']:.1f} m | "
+              f"right {peaks['right_queue_m']:.1f} m")
+
+def main():
+    parser = argparse.ArgumentParser(description="Adaptive traffic light control from CCTV video")
+    parser.add_argument('source', help="video file, camera index or stream URL")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--live', dest='live', action='store_true',
+                      help="treat the source as a live stream (default: auto-detect)")
+    mode.add_argument('--file', dest='live', action='store_false',
+                      help="treat the source as a file and process every frame")
+    parser.set_defaults(live=None)
+    parser.add_argument('--output', choices=['frames', 'none'], default='frames',
+                        help="write annotated frames or only compute counts and timings")
+    parser.add_argument('--output-dir', default='output')
+    parser.add_argument('--model', default='yolov8n.pt', help="YOLO weights to load")
+    parser.add_argument('--no-warmup', action='store_true', help="skip the model warm-up pass")
+    parser.add_argument('--conf', type=float, default=0.5, help="detection confidence threshold")
+    parser.add_argument('--cache-dir', default=None,
+                        help="reuse/store detections here; cached files skip decoding and inference")
+    parser.add_argument('--lanes', default=None,
+                        help="JSON file of lane polygons; default is to fit lanes from the video")
+    parser.add_argument('--lane-refresh', type=int, default=30,
+                        help="refit lane lines every N frames")
+    parser.add_argument('--count-log', default=None,
+                        help="write per-frame lane counts as a .npy log for replay in the simulation")
+    parser.add_argument('--emergency-classes', default=','.join(EMERGENCY_CLASSES),
+                        help="comma-separated model classes that preempt the signal")
+    parser.add_argument('--calibration', default=None,
+                        help="JSON file of image/road-plane reference points for metric distance, speed and queues")
+    args = parser.parse_args()
+
+    lane_polygons = load_lane_polygons(args.lanes) if args.lanes else None
+    ground_plane = load_calibration(args.calibration) if args.calibration else None
+
+    process_video(args.source, live=args.live, output=args.output, output_dir=args.output_dir,
+                  model_name=args.model, warmup=not args.no_warmup, conf_threshold=args.conf,
+                  cache_dir=args.cache_dir, lane_polygons=lane_polygons, lane_refresh=args.lane_refresh,
+                  count_log=args.count_log, emergency_classes=args.emergency_classes.split(','),
+                  ground_plane=ground_plane)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file